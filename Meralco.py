@@ -1,14 +1,35 @@
+import time
+process_start = time.perf_counter()  # before the other imports, which are part of startup
+
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import tkinter.font as tkFont, csv, json, os
+import tkinter.font as tkFont, csv, json, os, threading, bisect, sqlite3, argparse, sys, re, queue, mmap, struct
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from array import array
+from collections import deque
+from itertools import islice
+import cProfile, functools, pstats
+import multiprocessing
+import gzip, io, lzma
+import asyncio
+from urllib.parse import urlsplit, parse_qsl
 from datetime import datetime as dt
 
+try:
+    import fcntl  # store file locking (POSIX)
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+np = None  # optional: vectorized batch billing; imported by load_numpy, off the startup path
+
 # Global variables for Sub-Metering panels and the bill rate:
 sub_detail_vars_global = None
 sub_bottom_vars = None
-sub_update_top_consumption = None
-sub_update_sub = None
-global_bill_rate = 0  # Stores "Rate This Month" from the Bill Detail tab
+global_bill_rate = 0  # Mirrors the "Rate This Month" cell of calc_graph
+calc_graph = None  # CalcGraph shared by both tabs
+startup_timings = {}  # milestone -> seconds since process start
+io_executor = None  # IOExecutor created by start_app
 
 
 # --- Common Event Handler ---
@@ -28,116 +49,3496 @@ def on_enter(event):
     return "break"
 
 
-# --- Utility Classes and Functions ---
-class CreateToolTip:
-    def __init__(self, widget, text='widget info'):
-        self.widget = widget
-        self.text = text
-        widget.bind("<Enter>", self.enter)
-        widget.bind("<Leave>", self.leave)
-        self.top = None
+# --- Utility Classes and Functions ---
+class CreateToolTip:
+    def __init__(self, widget, text='widget info'):
+        self.widget = widget
+        self.text = text
+        widget.bind("<Enter>", self.enter)
+        widget.bind("<Leave>", self.leave)
+        self.top = None
+
+    def enter(self, event=None):
+        x = self.widget.winfo_rootx() + 20
+        y = self.widget.winfo_rooty() + 20
+        self.top = tk.Toplevel(self.widget)
+        self.top.overrideredirect(True)
+        self.top.geometry(f"+{x}+{y}")
+        tk.Label(self.top,
+                 text=self.text,
+                 justify='left',
+                 background="#ffffe0",
+                 relief='solid',
+                 borderwidth=1,
+                 font=("tahoma", "8", "normal")
+                 ).pack(ipadx=1)
+
+    def leave(self, event=None):
+        if self.top:
+            self.top.destroy()
+
+
+def parse_bill_date(value):
+    norm = value.strip().replace("-", "/").replace(".", "/").replace(" ", "/")
+    # Only a month name can match %b, and it never matches the numeric formats
+    for fmt in ("%d/%b/%Y",) if re.search("[A-Za-z]", norm) else ("%d/%m/%Y", "%d/%m/%y"):
+        try:
+            return dt.strptime(norm, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+@functools.lru_cache(maxsize=65536)
+def date_ordinal(value):
+    # Memoized: a reading dump repeats the same few period dates on thousands of rows
+    parsed = parse_bill_date(value) if value else None
+    return parsed.toordinal() if parsed else None
+
+
+@functools.lru_cache(maxsize=65536)
+def bill_date_text(value):
+    # DD/MM/YYYY, DD/MM/YY or DD-Mon-YYYY -> DD-Mon-YYYY; None if unparsable
+    ordinal = date_ordinal(value.strip()) if value else None
+    return dt.fromordinal(ordinal).strftime("%d-%b-%Y") if ordinal else None
+
+
+def convert_date_strvar(event, var):
+    text = bill_date_text(var.get().strip())
+    if text:
+        var.set(text)
+
+
+def format_combo_date(var):
+    text = bill_date_text(var.get().strip())
+    if text and text != var.get():  # no write when already formatted, so traces only see real edits
+        var.set(text)
+
+
+def read_bill_rows(fn):
+    with open(fn, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def bill_values(rows):
+    left = {}
+    for row in rows:
+        if not any(cell.strip() for cell in row):
+            continue
+        left[row[0]] = row[1]
+    return left
+
+
+def specific_values(rows):
+    try:
+        prev = rows[4][1]
+    except:
+        prev = "0"
+    try:
+        curr = rows[6][1]
+    except:
+        curr = "0"
+    try:
+        tot = rows[7][1]
+    except:
+        try:
+            tot = str(float(curr.replace(",", "")) - float(prev.replace(",", "")))
+        except:
+            tot = "0"
+    return prev, curr, tot
+
+
+def load_data(fn):
+    return bill_values(read_bill_rows(fn)), [], []
+
+
+def load_specific_values(fn):
+    return specific_values(read_bill_rows(fn))
+
+
+def load_bill_model(fn="bill_detail.csv"):
+    # One parse of the bill file shared by both tabs; Load File updates it in place
+    rows = read_bill_rows(fn)
+    left = bill_values(rows)
+    p, c, t = specific_values(rows)
+    left["Previous kWh Reading"] = p
+    left["Current kWh Reading"] = c
+    left["Total Actual Consumption (kWh)"] = ""
+    return left
+
+
+# --- Instrumentation ---
+PROFILE_WINDOW = 1024  # samples kept per operation for the rolling percentiles
+
+
+class Profiler:
+    # Wall-clock timings per operation in rolling windows, plus plain event counters.
+    # Setting capture_next runs the next timed action under cProfile and dumps a .prof file;
+    # its top functions are kept in last_report for the Diagnostics window.
+    def __init__(self, window=PROFILE_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.calls = {}
+        self.events = {}
+        self.capture_next = False
+        self.last_profile = None
+        self.last_report = ""
+
+    def record(self, name, seconds):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+                self.calls[name] = 0
+            samples.append(seconds)
+            self.calls[name] += 1
+
+    def count(self, name, n=1):
+        with self.lock:  # bumped from the event loop and the worker pools alike
+            self.events[name] = self.events.get(name, 0) + n
+
+    def take_capture(self):
+        # Only one of several concurrent actions gets the pending cProfile run
+        with self.lock:
+            capture, self.capture_next = self.capture_next, False
+            return capture
+
+    def timed(self, name):
+        def wrap(fn):
+            @functools.wraps(fn)
+            def timed_call(*args, **kwargs):
+                if self.capture_next and self.take_capture():
+                    return self.profile_call(name, fn, args, kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return timed_call
+        return wrap
+
+    def profile_call(self, name, fn, args, kwargs):
+        prof = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return prof.runcall(fn, *args, **kwargs)
+        finally:
+            self.record(name, time.perf_counter() - start)
+            path = f"profile_{re.sub(r'[^A-Za-z0-9_.]+', '_', name)}_{dt.now():%Y%m%d_%H%M%S}.prof"
+            prof.dump_stats(path)
+            report = io.StringIO()
+            pstats.Stats(prof, stream=report).sort_stats("cumulative").print_stats(15)
+            with self.lock:
+                self.last_profile, self.last_report = path, report.getvalue()
+
+    def stats(self):
+        # (operation, calls, p50 ms, p95 ms, max ms) rows; counters report calls only
+        rows = []
+        with self.lock:
+            for name, samples in sorted(self.samples.items()):
+                ordered = sorted(samples)
+                pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+                rows.append((name, self.calls[name], pick(0.5), pick(0.95), ordered[-1] * 1000))
+            for name, n in sorted(self.events.items()):
+                rows.append((name, n, None, None, None))
+        return rows
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.calls.clear()
+            self.events.clear()
+
+    def export(self, path):
+        rows = self.stats()
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["operation", "calls", "p50_ms", "p95_ms", "max_ms"])
+                writer.writerows(rows)
+                for name, seconds in startup_timings.items():
+                    writer.writerow([f"startup.{name}", 1, seconds * 1000, seconds * 1000, seconds * 1000])
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"operations": [dict(zip(("operation", "calls", "p50_ms", "p95_ms", "max_ms"), row))
+                                          for row in rows],
+                           "startup_ms": {k: v * 1000 for k, v in startup_timings.items()}}, f, indent=4)
+
+
+profiler = Profiler()
+
+
+# --- Sub-Meter Record Storage ---
+SUBMETER_JSON = "submeter.json"
+SUBMETER_JOURNAL = "submeter.jsonl"
+JOURNAL_COMPACT_THRESHOLD = 500
+STORE_LOCK_TIMEOUT = 10.0
+STORE_READ_RETRIES = 5
+ARCHIVE_DIR = "submeter_archive"
+ARCHIVE_KEEP_MONTHS = 24  # periods ending longer ago than this are archived at compaction; None keeps all
+
+
+class FileLock:
+    # Advisory lock on a side file shared by every process (and operator) using the store.
+    # Re-entrant within a process; only held for journal appends and compaction swaps.
+    def __init__(self, path, timeout=STORE_LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.handle = None
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        if self.depth:
+            self.depth += 1
+            return
+        handle = open(self.path, "a+b")
+        deadline = time.monotonic() + self.timeout
+        delay = 0.002
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    handle.seek(0)
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    handle.close()
+                    self.thread_lock.release()
+                    raise TimeoutError(f"{self.path} is locked by another process")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+        self.handle = handle
+        self.depth = 1
+
+    def release(self):
+        self.depth -= 1
+        if not self.depth:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+                else:
+                    self.handle.seek(0)
+                    msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                self.handle.close()
+                self.handle = None
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def latest_records(records):
+    # The last saved version of each key, at the position the key was first saved
+    position = {}
+    latest = []
+    for rec in records:
+        key = record_key(rec)
+        i = position.get(key)
+        if i is None:
+            position[key] = len(latest)
+            latest.append(rec)
+        else:
+            latest[i] = rec
+    return latest
+
+
+def retry_file_op(fn, *args, attempts=50):
+    # Windows refuses to replace or delete a file another process is reading; wait it out
+    for i in range(attempts):
+        try:
+            return fn(*args)
+        except PermissionError:
+            if i == attempts - 1:
+                raise
+            time.sleep(0.02)
+
+
+class SubmeterStore:
+    # submeter.json is the compacted snapshot; each Save only appends one line to the
+    # submeter.jsonl journal, which is folded back into the snapshot in the background.
+    # Several operators can share the files: appends take the file lock for one write,
+    # compaction seals the journal into a numbered segment, merges without the lock and
+    # swaps the snapshot in under it, and readers retry if a swap happened mid-read.
+    def __init__(self, json_path=SUBMETER_JSON, journal_path=SUBMETER_JOURNAL,
+                 compact_threshold=JOURNAL_COMPACT_THRESHOLD, archive=None, keep_months=ARCHIVE_KEEP_MONTHS):
+        self.json_path = json_path
+        self.journal_path = journal_path
+        self.compact_threshold = compact_threshold
+        self.archive = archive  # SubmeterArchive that closed periods move to at compaction
+        self.keep_months = keep_months
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(json_path + ".lock")
+        self.intent_path = json_path + ".compacting"
+        self.journal_count = None
+        self.compacting = False
+
+    def read_snapshot(self, strict=False):
+        if not os.path.exists(self.json_path):
+            return []
+        with open(self.json_path, "r", encoding="utf-8") as jf:
+            try:
+                data = json.load(jf)
+            except ValueError:
+                if strict:
+                    raise
+                return []
+        return data if isinstance(data, list) else [data]
+
+    def read_journal(self, path=None):
+        records = []
+        path = path or self.journal_path
+        if not os.path.exists(path):
+            return records
+        with open(path, "r", encoding="utf-8") as jf:
+            for line in jf:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # torn write left by a crash
+        return records
+
+    def segment_paths(self):
+        # Sealed journal segments (submeter.jsonl.1, .2, ...) waiting to be merged, oldest first
+        folder, name = os.path.split(os.path.abspath(self.journal_path))
+        pattern = re.compile(re.escape(name) + r"\.(\d+)$")
+        try:
+            found = [(int(m.group(1)), f) for f in os.listdir(folder) for m in [pattern.match(f)] if m]
+        except OSError:
+            return []
+        return [os.path.join(os.path.dirname(self.journal_path), f) for _, f in sorted(found)]
+
+    def state(self):
+        # Changes whenever a compaction seals the journal or swaps the snapshot
+        try:
+            st = os.stat(self.json_path)
+            snapshot = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            snapshot = None
+        return snapshot, tuple(self.segment_paths())
+
+    def signature(self):
+        sig = [self.state()]
+        try:
+            st = os.stat(self.journal_path)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append(None)
+        return tuple(sig)
+
+    def recover(self):
+        # Finishes or rolls back a compaction that crashed around the snapshot swap
+        if not os.path.exists(self.intent_path):
+            return
+        with self.file_lock:
+            try:
+                with open(self.intent_path, "r", encoding="utf-8") as f:
+                    intent = json.load(f)
+            except (OSError, ValueError):
+                intent = None
+            if intent is not None:
+                if os.path.exists(intent["tmp"]):
+                    os.remove(intent["tmp"])  # swap never happened; segments still count
+                else:
+                    for path in intent["segments"]:
+                        if os.path.exists(path):
+                            os.remove(path)  # already merged into the snapshot
+            if os.path.exists(self.intent_path):
+                os.remove(self.intent_path)
+
+    def read_all(self, segments, strict=False):
+        records = self.read_snapshot(strict)
+        for path in segments:
+            records += self.read_journal(path)
+        return records
+
+    def load(self):
+        with self.lock:
+            self.recover()
+            for _ in range(STORE_READ_RETRIES):
+                before = self.state()
+                try:
+                    records = self.read_all(before[1])
+                    journal = self.read_journal()
+                except FileNotFoundError:
+                    continue
+                if self.state() == before:
+                    break
+            else:
+                with self.file_lock:  # compactions keep winning the race; read under the lock
+                    records = self.read_all(self.segment_paths())
+                    journal = self.read_journal()
+            self.journal_count = len(journal)
+            return records + journal
+
+    def append_many(self, records):
+        # Returns the store signature right after this write, taken before anyone else can append
+        if not records:
+            return self.signature()
+        data = "".join(json.dumps(rec, separators=(",", ":")) + "\n" for rec in records).encode("utf-8")
+        with self.lock:
+            with self.file_lock, open(self.journal_path, "a+b") as jf:
+                jf.seek(0, os.SEEK_END)
+                if jf.tell():
+                    jf.seek(-1, os.SEEK_END)
+                    if jf.read(1) != b"\n":
+                        data = b"\n" + data
+                jf.write(data)
+                jf.flush()
+                os.fsync(jf.fileno())
+            written = self.signature()
+            if self.journal_count is None:
+                self.journal_count = len(self.read_journal())
+            else:
+                self.journal_count += len(records)
+            needs_compact = self.journal_count >= self.compact_threshold
+        if needs_compact:
+            self.compact_async()
+        return written
+
+    def append(self, record):
+        self.append_many([record])
+
+    def seal_journal(self):
+        with self.file_lock:
+            if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path):
+                numbers = [int(p.rsplit(".", 1)[1]) for p in self.segment_paths()]
+                retry_file_op(os.replace, self.journal_path, f"{self.journal_path}.{max(numbers, default=0) + 1}")
+
+    def compact(self):
+        # The merge and rewrite run without self.lock, so saves keep appending to the fresh journal;
+        # the archive merge and the swap happen under the file lock, which appends take as well
+        self.recover()
+        with self.lock:
+            self.seal_journal()
+            self.journal_count = 0
+        tmp_path = f"{self.json_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        while True:
+            before = self.state()
+            try:
+                records = latest_records(self.read_all(before[1], strict=True))
+            except FileNotFoundError:
+                continue  # a segment was merged by another operator
+            old = []
+            if self.archive is not None and self.keep_months is not None:
+                old, records = self.archive.split(records, archive_cutoff(self.keep_months))
+            with open(tmp_path, "w", encoding="utf-8") as jf:
+                json.dump(records, jf, indent=4)  # superseded versions are dropped here
+                jf.flush()
+                os.fsync(jf.fileno())
+            with self.file_lock:
+                if self.state() != before:
+                    continue  # another operator compacted meanwhile; merge again
+                if old:
+                    # Under the file lock, so operators never merge a year segment at once, and before
+                    # the swap: after a crash a record is in both tiers, and the hot one wins
+                    self.archive.add(old)
+                with open(self.intent_path, "w", encoding="utf-8") as f:
+                    json.dump({"tmp": tmp_path, "segments": list(before[1])}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                retry_file_op(os.replace, tmp_path, self.json_path)
+                for path in before[1]:
+                    retry_file_op(os.remove, path)
+                os.remove(self.intent_path)
+                break
+        with self.lock:
+            self.journal_count = len(self.read_journal())
+            self.compacting = False
+        return len(records)
+
+    def compact_async(self):
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                print("Error compacting submeter journal:", e)
+                self.compacting = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+# --- Sub-Meter Archive ---
+ARCHIVE_CODECS = {"gzip": (".jsonl.gz", gzip.compress, gzip.decompress, lambda f: gzip.GzipFile(fileobj=f)),
+                  "lzma": (".jsonl.xz", lzma.compress, lzma.decompress, lzma.LZMAFile)}
+ARCHIVE_TRAILER = struct.Struct("<Q8s")  # footer length, magic
+ARCHIVE_MAGIC = b"MARCHV1\x00"
+ARCHIVE_CACHE_SEGMENTS = 2
+
+
+def archive_cutoff(keep_months=ARCHIVE_KEEP_MONTHS, today=None):
+    # Ordinal of the first day of the oldest month still kept in submeter.json
+    today = today or dt.now()
+    months = today.year * 12 + today.month - 1 - keep_months
+    return dt(months // 12, months % 12 + 1, 1).toordinal()
+
+
+class SubmeterArchive:
+    # Closed billing periods in one compressed JSON Lines segment per year. Each segment ends
+    # with an uncompressed footer listing its key values, so the filters can offer archived
+    # periods and a lookup opens only the segments that can hold the record.
+    def __init__(self, folder=ARCHIVE_DIR, codec="gzip"):
+        self.folder = folder
+        self.codec = codec
+        self.lock = threading.RLock()
+        self.footers = {}  # path -> ((mtime_ns, size), footer)
+        self.cache = {}  # path -> ((mtime_ns, size), {key: record})
+        self.rollup_cache = {}  # path -> ((mtime_ns, size), [rollup_entry(record)])
+
+    def segment_paths(self):
+        try:
+            names = os.listdir(self.folder)
+        except OSError:
+            return []
+        suffixes = tuple(codec[0] for codec in ARCHIVE_CODECS.values())
+        return sorted(os.path.join(self.folder, n) for n in names
+                      if n.startswith("submeter_") and n.endswith(suffixes))
+
+    def segment_path(self, year, codec=None):
+        return os.path.join(self.folder, f"submeter_{year}{ARCHIVE_CODECS[codec or self.codec][0]}")
+
+    def read_footer(self, path):
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            cached = self.footers.get(path)
+            if cached and cached[0] == stamp:
+                return cached[1]
+        with open(path, "rb") as f:
+            f.seek(-ARCHIVE_TRAILER.size, os.SEEK_END)
+            length, magic = ARCHIVE_TRAILER.unpack(f.read(ARCHIVE_TRAILER.size))
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(f"{path} is not a sub-meter archive segment")
+            f.seek(-ARCHIVE_TRAILER.size - length, os.SEEK_END)
+            footer = json.loads(f.read(length).decode("utf-8"))
+        with self.lock:
+            self.footers[path] = (stamp, footer)
+        return footer
+
+    def read_segment(self, path):
+        footer = self.read_footer(path)
+        with open(path, "rb") as f:
+            body = f.read(footer["body_size"])
+        text = ARCHIVE_CODECS[footer["codec"]][2](body).decode("utf-8")
+        return [json.loads(line) for line in text.splitlines() if line]
+
+    def iter_segment(self, path):
+        # Decompresses a line at a time; only the compressed body is held in memory
+        footer = self.read_footer(path)
+        with open(path, "rb") as f:
+            body = io.BytesIO(f.read(footer["body_size"]))
+        with io.TextIOWrapper(ARCHIVE_CODECS[footer["codec"]][3](body), encoding="utf-8") as lines:
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+
+    def write_segment(self, path, records, codec):
+        suffix, compress = ARCHIVE_CODECS[codec][:2]
+        body = compress("".join(json.dumps(rec, separators=(",", ":")) + "\n" for rec in records).encode("utf-8"))
+        keys = [record_key(rec) for rec in records]
+        footer = {"codec": codec, "count": len(records), "body_size": len(body),
+                  "values": {field: sorted({key[i] for key in keys}) for i, field in enumerate(RECORD_KEY_FIELDS)}}
+        footer = json.dumps(footer, separators=(",", ":")).encode("utf-8")
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+            f.write(footer)
+            f.write(ARCHIVE_TRAILER.pack(len(footer), ARCHIVE_MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+        retry_file_op(os.replace, tmp_path, path)
+
+    def add(self, records, codec=None):
+        # Merges records into their year segments; a record saved again replaces the archived one.
+        # The read-modify-write is only safe across processes under the store's file lock.
+        by_year = {}
+        for rec in records:
+            ordinal = date_ordinal(rec.get("Sub_Meter", {}).get("Billing Period Up To", ""))
+            by_year.setdefault(dt.fromordinal(ordinal).year, []).append(rec)
+        with self.lock:
+            for year, recs in sorted(by_year.items()):
+                existing = [p for p in self.segment_paths()
+                            if os.path.basename(p).startswith(f"submeter_{year}.")]
+                old = [rec for path in existing for rec in self.read_segment(path)]
+                path = self.segment_path(year, codec)
+                self.write_segment(path, latest_records(old + recs), codec or self.codec)
+                for other in existing:
+                    if other != path:
+                        os.remove(other)  # re-encoded with another codec
+        return len(records)
+
+    def split(self, records, cutoff):
+        # (records whose period ended before cutoff (an ordinal), the rest); add() archives the first
+        old, keep = [], []
+        ordinals = {}
+        for rec in records:
+            value = rec.get("Sub_Meter", {}).get("Billing Period Up To", "")
+            ordinal = ordinals.get(value)
+            if ordinal is None:
+                ordinal = ordinals[value] = date_ordinal(value) or 0
+            (old if ordinal and ordinal < cutoff else keep).append(rec)
+        return old, keep
+
+    def values(self, field):
+        i = RECORD_KEY_FIELDS.index(field)
+        found = set()
+        for path in self.segment_paths():
+            try:
+                found.update(self.read_footer(path)["values"][RECORD_KEY_FIELDS[i]])
+            except (OSError, ValueError, KeyError) as e:
+                print("Error reading archive footer:", path, e)
+        found.discard("")
+        return found
+
+    def iter_records(self, filters=None, lo=None, hi=None):
+        # Streams archived records, skipping segments whose year or footer rules them out.
+        # A segment holds the periods that ended in its year, and a period ends after it starts.
+        for path in self.segment_paths():
+            year = int(re.match(r"submeter_(\d+)", os.path.basename(path)).group(1))
+            if (lo and year < dt.fromordinal(lo).year) or (hi and year > dt.fromordinal(hi).year):
+                continue
+            values = self.read_footer(path)["values"]
+            if all(v in values[f] for f, v in (filters or {}).items()):
+                yield from self.iter_segment(path)
+
+    def rollup_entries(self):
+        # rollup_entry() of every archived record; a segment is decompressed again only after it changed
+        entries = []
+        for path in self.segment_paths():
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            with self.lock:
+                cached = self.rollup_cache.get(path)
+            if cached is None or cached[0] != stamp:
+                cached = (stamp, [rollup_entry(rec) for rec in self.iter_segment(path)])
+                with self.lock:
+                    self.rollup_cache[path] = cached
+            entries.extend(cached[1])
+        return entries
+
+    def export_rows(self, fields, filters, lo, hi, is_saved):
+        # export_rows() tail shared by the index engines: archived periods not saved again since
+        for rec in self.iter_records(filters, lo, hi):
+            if any(record_field(rec, f) != v for f, v in (filters or {}).items()) or is_saved(record_key(rec)):
+                continue
+            if lo is not None or hi is not None:
+                f_ord = date_ordinal(record_field(rec, "Billing Period From")) or 0
+                t_ord = date_ordinal(record_field(rec, "Billing Period Up To")) or 0
+                if not period_within(f_ord, t_ord, lo, hi):
+                    continue
+            yield [record_field(rec, f) for f in fields]
+
+    def lookup(self, file_key, auth, bpf, bpu):
+        key = (file_key, auth, bpf, bpu)
+        for path in self.segment_paths():
+            values = self.read_footer(path)["values"]
+            if not all(v in values[f] for f, v in zip(RECORD_KEY_FIELDS, key)):
+                continue
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            with self.lock:
+                cached = self.cache.get(path)
+                if cached is None or cached[0] != stamp:
+                    profiler.count("archive.segment_load")
+                    if len(self.cache) >= ARCHIVE_CACHE_SEGMENTS:
+                        self.cache.pop(next(iter(self.cache)))
+                    cached = self.cache[path] = (stamp, {record_key(r): r for r in self.read_segment(path)})
+            rec = cached[1].get(key)
+            if rec is not None:
+                return rec
+        return None
+
+
+RECORD_KEY_FIELDS = ("FileKey", "Auth", "Billing Period From", "Billing Period Up To")
+
+
+def record_key(rec):
+    sub_data = rec.get("Sub_Meter", {})
+    return (rec.get("FileKey", ""),
+            sub_data.get("Auth", ""),
+            sub_data.get("Billing Period From", ""),
+            sub_data.get("Billing Period Up To", ""))
+
+
+BROWSER_COLUMNS = (
+    ("FileKey", "text", 280),
+    ("Auth", "text", 90),
+    ("Billing Period From", "date", 95),
+    ("Previous kWh Reading", "number", 90),
+    ("Billing Period Up To", "date", 95),
+    ("Current kWh Reading", "number", 90),
+    ("Total Actual Consumption (kWh)", "number", 90),
+    ("Total Amount", "number", 90),
+)
+BROWSER_COLUMN_KINDS = {name: kind for name, kind, _ in BROWSER_COLUMNS}
+
+
+def record_field(rec, field):
+    if field == "FileKey":
+        return rec.get("FileKey", "")
+    return rec.get("Sub_Meter", {}).get(field, "")
+
+
+# --- Columnar Record Store ---
+SUB_METER_FIELDS = tuple(name for name, _, _ in BROWSER_COLUMNS[1:])
+SUB_METER_FIELD_SET = frozenset(SUB_METER_FIELDS)
+TEXT_FIELDS = ("FileKey", "Auth")
+DATE_FIELDS = ("Billing Period From", "Billing Period Up To")
+NUMBER_FIELDS = ("Previous kWh Reading", "Current kWh Reading", "Total Actual Consumption (kWh)", "Total Amount")
+NUMBER_STYLES = ("{:.0f}", "{:,.0f}", "{:.2f}", "{:,.2f}")  # how the form writes numbers
+STYLE_EMPTY, STYLE_MISSING, STYLE_TEXT = -1, -2, -3
+MISSING = -1
+
+
+class StringPool:
+    # Dictionary encoding: each distinct string is stored once and referenced by id
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def intern(self, value):
+        vid = self.ids.get(value)
+        if vid is None:
+            vid = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return vid
+
+
+class RecordColumns:
+    # Sub-meter records held column-wise: FileKey/Auth/dates as pool ids, readings and amounts
+    # as doubles with a one-byte format style so the original text can be rebuilt exactly.
+    # Records are converted back to the submeter.json dict shape only when asked for.
+    def __init__(self):
+        self.text_pools = {field: StringPool() for field in TEXT_FIELDS}
+        self.dates = StringPool()
+        self.date_ordinals = array("i")  # per date pool id, 0 if unparsable
+        self.text_ids = {field: array("i") for field in TEXT_FIELDS}
+        self.date_ids = {field: array("i") for field in DATE_FIELDS}
+        self.numbers = {field: array("d") for field in NUMBER_FIELDS}
+        self.styles = {field: array("b") for field in NUMBER_FIELDS}
+        self.texts = {}  # (row, field) -> original text that no style reproduces
+        self.extras = {}  # row -> (top-level extras, Sub_Meter extras)
+
+    def __len__(self):
+        return len(self.text_ids["FileKey"])
+
+    def intern_date(self, value):
+        vid = self.dates.intern(value)
+        if vid == len(self.date_ordinals):
+            self.date_ordinals.append(date_ordinal(value) or 0)
+        return vid
+
+    def append(self, rec):
+        row = len(self)
+        sub = rec.get("Sub_Meter", {})
+        for field in TEXT_FIELDS:
+            value = rec.get(field) if field == "FileKey" else sub.get(field)
+            self.text_ids[field].append(MISSING if value is None else self.text_pools[field].intern(value))
+        for field in DATE_FIELDS:
+            value = sub.get(field)
+            self.date_ids[field].append(MISSING if value is None else self.intern_date(value))
+        for field in NUMBER_FIELDS:
+            value, style = self.encode_number(sub.get(field))
+            if style == STYLE_TEXT:
+                self.texts[(row, field)] = sub[field]
+            self.numbers[field].append(value)
+            self.styles[field].append(style)
+        if len(rec) != 2 or "Sub_Meter" not in rec or not SUB_METER_FIELD_SET.issuperset(sub):
+            top_extra = {k: v for k, v in rec.items() if k not in ("FileKey", "Sub_Meter")}
+            sub_extra = {k: v for k, v in sub.items() if k not in SUB_METER_FIELD_SET}
+            if top_extra or sub_extra or "Sub_Meter" not in rec:
+                self.extras[row] = (top_extra, sub_extra, "Sub_Meter" in rec)
+        return row
+
+    def extend(self, records, chunk_size=4096):
+        # Bulk load: column-at-a-time over chunks of regular records, each distinct string
+        # interned and each distinct number text encoded once
+        records = list(records)
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start:start + chunk_size]
+            if not all(len(rec) == 2 and "Sub_Meter" in rec and SUB_METER_FIELD_SET.issuperset(rec["Sub_Meter"])
+                       for rec in chunk):
+                for rec in chunk:
+                    self.append(rec)
+                continue
+            row = len(self)
+            subs = [rec["Sub_Meter"] for rec in chunk]
+            for field in TEXT_FIELDS:
+                values = [rec.get(field) for rec in chunk] if field == "FileKey" else [sub.get(field) for sub in subs]
+                pool = self.text_pools[field]
+                for value in set(values) - pool.ids.keys() - {None}:
+                    pool.intern(value)
+                ids = pool.ids
+                self.text_ids[field].extend([ids.get(value, MISSING) for value in values])
+            for field in DATE_FIELDS:
+                values = [sub.get(field) for sub in subs]
+                for value in set(values) - self.dates.ids.keys() - {None}:
+                    self.intern_date(value)
+                ids = self.dates.ids
+                self.date_ids[field].extend([ids.get(value, MISSING) for value in values])
+            for field in NUMBER_FIELDS:
+                texts = [sub.get(field) for sub in subs]
+                encoded = {text: self.encode_number(text) for text in set(texts)}
+                pairs = [encoded[text] for text in texts]
+                self.numbers[field].extend([pair[0] for pair in pairs])
+                self.styles[field].extend([pair[1] for pair in pairs])
+                if any(pair[1] == STYLE_TEXT for pair in encoded.values()):
+                    for i, text in enumerate(texts):
+                        if encoded[text][1] == STYLE_TEXT:
+                            self.texts[(row + i, field)] = text
+
+    @staticmethod
+    def encode_number(text):
+        if text is None:
+            return 0.0, STYLE_MISSING
+        if text == "":
+            return 0.0, STYLE_EMPTY
+        if isinstance(text, str):
+            if text.isdigit() and (text[0] != "0" or text == "0") and len(text) < 16:
+                return float(text), 0
+            plain = text.replace(",", "")
+            try:
+                value = float(plain)
+            except ValueError:
+                return 0.0, STYLE_TEXT
+            style = (1 if plain is not text else 0) + (2 if "." in plain else 0)
+            if NUMBER_STYLES[style].format(value) == text:
+                return value, style
+            return value, STYLE_TEXT
+        return parse_reading(text), STYLE_TEXT
+
+    def text(self, row, field):
+        if field in self.text_ids:
+            vid = self.text_ids[field][row]
+            return None if vid == MISSING else self.text_pools[field].values[vid]
+        if field in self.date_ids:
+            vid = self.date_ids[field][row]
+            return None if vid == MISSING else self.dates.values[vid]
+        style = self.styles[field][row]
+        if style >= 0:
+            return NUMBER_STYLES[style].format(self.numbers[field][row])
+        if style == STYLE_TEXT:
+            return self.texts[(row, field)]
+        return "" if style == STYLE_EMPTY else None
+
+    def record(self, row):
+        top_extra, sub_extra, has_sub = self.extras.get(row, (None, None, True))
+        rec = {}
+        file_key = self.text(row, "FileKey")
+        if file_key is not None:
+            rec["FileKey"] = file_key
+        if has_sub:
+            sub = rec["Sub_Meter"] = {}
+            for field in SUB_METER_FIELDS:
+                value = self.text(row, field)
+                if value is not None:
+                    sub[field] = value
+            if sub_extra:
+                sub.update(sub_extra)
+        if top_extra:
+            rec.update(top_extra)
+        return rec
+
+    def records(self, rows=None):
+        # Lazily rebuilds the submeter.json dicts for the given rows (all rows by default)
+        for row in range(len(self)) if rows is None else rows:
+            yield self.record(row)
+
+    def column(self, field, rows=None):
+        # Numbers as doubles; FileKey/Auth as pool ids; dates as ordinals (0 if unparsable).
+        # Numbers and ids are zero-copy NumPy views, which must be dropped before the next
+        # append (an array cannot grow while a view of it is alive).
+        if field in self.numbers:
+            values = self.numbers[field]
+        elif field in self.text_ids:
+            values = self.text_ids[field]
+        else:
+            ids = self.date_ids[field]
+            if np is not None:
+                ids = np.frombuffer(ids, dtype=np.int32) if len(ids) else np.zeros(0, np.int32)
+                if rows is not None:
+                    ids = ids[np.asarray(rows, dtype=np.int64)]
+                values = np.zeros(len(ids), np.int32)
+                valid = ids != MISSING
+                values[valid] = np.frombuffer(self.date_ordinals, dtype=np.int32)[ids[valid]]
+                return values
+            ordinals = self.date_ordinals
+            values = array("i", (ordinals[i] if i != MISSING else 0 for i in ids))
+        if np is not None:
+            dtype = np.float64 if values.typecode == "d" else np.int32
+            values = np.frombuffer(values, dtype=dtype) if len(values) else np.zeros(0, dtype)
+            return values if rows is None else values[np.asarray(rows, dtype=np.int64)]
+        return values if rows is None else [values[r] for r in rows]
+
+    def sort_keys(self, field, rows):
+        # Keys for ordering rows by a browser column, straight from the typed columns
+        if field in self.text_ids:
+            values = self.text_pools[field].values
+            return [values[i] if i != MISSING else "" for i in (self.text_ids[field][r] for r in rows)]
+        column = self.column(field, rows)
+        return column.tolist() if np is not None else list(column)
+
+    def total(self, field, rows=None):
+        column = self.column(field, rows)
+        return float(column.sum()) if np is not None else float(sum(column))
+
+    def group_totals(self, group_field, field, rows=None):
+        # {FileKey or Auth: summed column} in one pass over the typed columns
+        names = self.text_pools[group_field].values
+        ids, values = self.column(group_field, rows), self.column(field, rows)
+        if np is not None:
+            if not len(ids):
+                return {}
+            ids = ids.astype(np.int64)
+            valid = ids >= 0
+            sums = np.bincount(ids[valid], weights=values[valid], minlength=len(names))
+            present = np.bincount(ids[valid], minlength=len(names)) > 0
+            return {names[i]: float(sums[i]) for i in np.flatnonzero(present)}
+        totals = {}
+        for vid, value in zip(ids, values):
+            if vid != MISSING:
+                totals[names[vid]] = totals.get(names[vid], 0.0) + value
+        return totals
+
+
+SEARCH_FIELDS = ("FileKey", "Auth")
+SEARCH_LIMIT = 50
+
+
+class KeySearch:
+    # Case-folded keys kept sorted for prefix lookups by bisect, plus a trigram index
+    # (gram -> ascending value ids) for substring matches. Values are only ever added.
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+        self.sorted_keys = []  # (folded value, id)
+        self.grams = {}
+        self.unsorted = False
+
+    def add(self, value, bulk=False):
+        if not value or value in self.ids:
+            return
+        vid = len(self.values)
+        self.values.append(value)
+        self.ids[value] = vid
+        folded = value.casefold()
+        if bulk:
+            self.sorted_keys.append((folded, vid))
+            self.unsorted = True
+        else:
+            bisect.insort(self.sorted_keys, (folded, vid))
+        for gram in {folded[i:i + 3] for i in range(len(folded) - 2)}:
+            postings = self.grams.get(gram)
+            if postings is None:
+                postings = self.grams[gram] = array("i")
+            postings.append(vid)
+
+    def finish_bulk(self):
+        if self.unsorted:
+            self.sorted_keys.sort()
+            self.unsorted = False
+
+    def prefix(self, folded, limit):
+        keys = self.sorted_keys
+        i = bisect.bisect_left(keys, (folded, -1))
+        found = []
+        while i < len(keys) and len(found) < limit and keys[i][0].startswith(folded):
+            found.append(self.values[keys[i][1]])
+            i += 1
+        return found
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        # Prefix matches first, then other values containing the text
+        folded = text.strip().casefold()
+        if not folded:
+            return [self.values[i] for _, i in self.sorted_keys[:limit]]
+        found = self.prefix(folded, limit)
+        if len(found) >= limit or len(folded) < 3:
+            return found
+        postings = [self.grams.get(folded[i:i + 3]) for i in range(len(folded) - 2)]
+        if any(p is None for p in postings):
+            return found
+        seen = set(found)
+        extra = []
+        for i in min(postings, key=len):
+            value = self.values[i]
+            if folded in value.casefold() and value not in seen:
+                extra.append(value)
+                if len(found) + len(extra) >= limit:
+                    break
+        return found + sorted(extra)
+
+
+# --- Consumption Rollups ---
+def billing_month(value):
+    # "YYYY-MM" of a period date, "" if it does not parse
+    ordinal = date_ordinal(value) if value else None
+    return dt.fromordinal(ordinal).strftime("%Y-%m") if ordinal else ""
+
+
+def month_shift(month, delta):
+    year, mon = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + delta, 12)
+    return f"{year:04d}-{mon + 1:02d}"
+
+
+def rollup_entry(rec):
+    # (key, then the ConsumptionRollups.add arguments) of one record
+    sub = rec.get("Sub_Meter", {})
+    return (record_key(rec), rec.get("FileKey", ""), sub.get("Auth", ""),
+            billing_month(sub.get("Billing Period Up To", "")),
+            parse_reading(sub.get("Total Actual Consumption (kWh)") or 0), parse_reading(sub.get("Total Amount") or 0))
+
+
+class ConsumptionRollups:
+    # Running [kWh, amount, records] totals per Auth per month, per FileKey (one main bill)
+    # and per month building-wide, keyed by the month of Billing Period Up To. Kept up by
+    # the record index as records are added, so queries never rescan the records.
+    def __init__(self):
+        self.by_auth = {}  # month -> {auth: totals}
+        self.by_file_key = {}  # file key -> totals
+        self.by_month = {}  # month -> totals
+        self.sorted_months = []  # keys of by_month, insorted as new months appear
+        self.date_columns = None  # the RecordColumns date_months was built from
+        self.date_months = []  # month of each date pool id, extended as dates are added
+        self.archived = {}  # key -> add() arguments of the archived records counted in
+
+    def add(self, file_key, auth, month, kwh, amount, sign=1):
+        if month not in self.by_month:
+            bisect.insort(self.sorted_months, month)
+        for totals in (self.by_auth.setdefault(month, {}).setdefault(auth, [0.0, 0.0, 0]),
+                       self.by_file_key.setdefault(file_key, [0.0, 0.0, 0]),
+                       self.by_month.setdefault(month, [0.0, 0.0, 0])):
+            totals[0] += sign * kwh
+            totals[1] += sign * amount
+            totals[2] += sign
+
+    def add_record(self, rec, sign=1):
+        self.add(*rollup_entry(rec)[1:], sign)
+
+    def add_archived(self, entries, is_saved):
+        # Archived periods count unless the working set has a later save of the same key
+        for key, *args in entries:
+            if key not in self.archived and not is_saved(key):
+                self.archived[key] = args
+                self.add(*args)
+
+    def drop_archived(self, key):
+        # An archived period was saved again: the new save replaces it in the totals
+        args = self.archived.pop(key, None)
+        if args is not None:
+            self.add(*args, sign=-1)
+
+    def add_rows(self, columns, rows, sign=1):
+        # Straight from the typed columns; each distinct date is turned into a month once
+        if columns is not self.date_columns:
+            self.date_columns, self.date_months = columns, []
+        months = self.date_months
+        months.extend(dt.fromordinal(o).strftime("%Y-%m") if o > 0 else ""
+                      for o in columns.date_ordinals[len(months):])
+        file_keys, auths = columns.text_pools["FileKey"].values, columns.text_pools["Auth"].values
+        file_key_ids, auth_ids = columns.text_ids["FileKey"], columns.text_ids["Auth"]
+        to_ids = columns.date_ids["Billing Period Up To"]
+        kwh, amount = columns.numbers["Total Actual Consumption (kWh)"], columns.numbers["Total Amount"]
+        for row in rows:
+            self.add(file_keys[file_key_ids[row]] if file_key_ids[row] != MISSING else "",
+                     auths[auth_ids[row]] if auth_ids[row] != MISSING else "",
+                     months[to_ids[row]] if to_ids[row] != MISSING else "", kwh[row], amount[row], sign)
+
+    def months(self):
+        return [m for m in self.sorted_months if m and self.by_month[m][2]]
+
+    def monthly_totals(self):
+        return [(m, *self.by_month[m]) for m in self.months()]
+
+    def file_key_totals(self):
+        return sorted((k, *t) for k, t in self.by_file_key.items() if t[2])
+
+    def top_consumers(self, start=None, end=None, limit=10):
+        # Auths with the most kWh over the months start..end ("YYYY-MM", inclusive)
+        totals = {}
+        for month in self.months():
+            if (start and month < start) or (end and month > end):
+                continue
+            for auth, (kwh, amount, n) in self.by_auth[month].items():
+                t = totals.setdefault(auth, [0.0, 0.0, 0])
+                t[0] += kwh
+                t[1] += amount
+                t[2] += n
+        ranked = sorted(totals.items(), key=lambda item: -item[1][0])
+        return [(auth, *t) for auth, t in ranked[:limit] if t[2]]
+
+    def month_over_month(self, auth=None, start=None, end=None):
+        # (month, auth, kWh, previous month kWh, change %) for each Auth billed in a month
+        rows = []
+        for month in self.months():
+            if (start and month < start) or (end and month > end):
+                continue
+            previous = self.by_auth.get(month_shift(month, -1), {})
+            for name, (kwh, _, n) in sorted(self.by_auth[month].items()):
+                if not n or (auth and name != auth):
+                    continue
+                before = previous.get(name)
+                before = before[0] if before and before[2] else None
+                change = (kwh - before) / before * 100 if before else None
+                rows.append((month, name, kwh, before, change))
+        return rows
+
+
+RECORD_INDEX_STATE = ("columns", "by_key", "unique", "position", "sort_keys", "orders", "by_field",
+                      "sorted_values", "search", "rollups")
+INDEX_REFRESH_RETRIES = 3  # reloads while other saves keep landing, before the last load is used anyway
+
+
+class RecordIndex:
+    # Primary index on (FileKey, Auth, From, Up To) plus one posting list and one sorted
+    # value list per field. Rebuilt only when the store files change on disk. The records
+    # themselves live in RecordColumns; the index holds row numbers.
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.RLock()
+        self.signature = None
+        self.clear()
+
+    def clear(self):
+        self.columns = RecordColumns()
+        self.by_key = {}  # key -> row of its latest version
+        self.unique = array("i")  # one row per key, in the order keys were first saved
+        self.position = {}  # key -> index in unique
+        self.sort_keys = {}
+        self.orders = {}
+        self.by_field = [{} for _ in RECORD_KEY_FIELDS]
+        self.sorted_values = [[] for _ in RECORD_KEY_FIELDS]
+        self.search = {field: KeySearch() for field in SEARCH_FIELDS}
+        self.rollups = ConsumptionRollups()
+
+    def file_signature(self):
+        return self.store.signature()
+
+    def add(self, rec, bulk=False):
+        return self.add_row(record_key(rec), self.columns.append(rec), bulk)
+
+    def add_row(self, key, row, bulk=False):
+        # Returns True when the record replaces an earlier save of the same key
+        pos = self.position.get(key)
+        if pos is not None:
+            old = self.unique[pos]
+            self.unique[pos] = row
+            self.by_key[key] = row
+            if not bulk:
+                self.rollups.add_rows(self.columns, (old,), sign=-1)
+                self.rollups.add_rows(self.columns, (row,))
+            self.sort_keys = {}
+            self.orders = {}
+            return True
+        self.by_key[key] = row
+        self.position[key] = len(self.unique)
+        self.unique.append(row)
+        if not bulk:
+            self.rollups.drop_archived(key)
+            self.rollups.add_rows(self.columns, (row,))
+        if self.sort_keys:
+            self.sort_keys = {}
+            self.orders = {}
+        for i, value in enumerate(key):
+            postings = self.by_field[i].get(value)
+            if postings is None:
+                postings = self.by_field[i][value] = []
+                if value:
+                    if bulk:
+                        self.sorted_values[i].append(value)
+                    else:
+                        bisect.insort(self.sorted_values[i], value)
+                    field = RECORD_KEY_FIELDS[i]
+                    if field in self.search:
+                        self.search[field].add(value, bulk)
+            postings.append(key)
+        return False
+
+    def rebuild(self, records):
+        with self.lock:
+            self.clear()
+            records = list(records)
+            self.columns.extend(records)
+            for row, rec in enumerate(records):
+                self.add_row(record_key(rec), row, bulk=True)
+            for values in self.sorted_values:
+                values.sort()
+            for search in self.search.values():
+                search.finish_bulk()
+            self.rollups.add_rows(self.columns, self.unique)
+            if self.store.archive is not None:
+                self.rollups.add_archived(self.store.archive.rollup_entries(), self.by_key.__contains__)
+
+    def refresh(self):
+        # Loads and builds a fresh index without holding the lock, so type-ahead and paging keep
+        # answering from the current one; only the swap happens under the lock. A save that
+        # lands meanwhile changes the signature and the load is repeated, a few times at most:
+        # under a steady stream of saves the last load is swapped in with the signature taken
+        # before it, so the next refresh picks up what it missed.
+        for attempt in range(INDEX_REFRESH_RETRIES):
+            with self.lock:
+                sig = self.file_signature()
+                if sig == self.signature:
+                    return
+            fresh = RecordIndex(self.store)
+            fresh.rebuild(self.store.load())
+            with self.lock:
+                if self.file_signature() == sig or attempt == INDEX_REFRESH_RETRIES - 1:
+                    for name in RECORD_INDEX_STATE:
+                        setattr(self, name, getattr(fresh, name))
+                    self.signature = sig
+                    return
+
+    def append_many(self, records):
+        # Upsert: the journal keeps every save, the index (and compaction) only the latest.
+        # The fsync'd write runs outside the index lock so type-ahead and paging don't wait on it.
+        with self.lock:
+            before = self.signature
+            in_sync = self.file_signature() == before
+        written = self.store.append_many(records)
+        with self.lock:
+            replaced = sum(self.add(rec) for rec in records)
+            if in_sync and self.signature == before:
+                self.signature = written
+            return replaced
+
+    def append(self, rec):
+        return self.append_many([rec]) > 0
+
+    def values(self, field):
+        with self.lock:
+            return list(self.sorted_values[RECORD_KEY_FIELDS.index(field)])
+
+    def with_rollups(self, fn):
+        with self.lock:
+            return fn(self.rollups)
+
+    def lookup(self, file_key, auth, bpf, bpu):
+        with self.lock:
+            row = self.by_key.get((file_key, auth, bpf, bpu))
+            return None if row is None else self.columns.record(row)
+
+    def suggest(self, field, text, limit=SEARCH_LIMIT):
+        with self.lock:
+            return self.search[field].search(text, limit)
+
+    def find(self, filters, offset=0, limit=None):
+        # filters maps a RECORD_KEY_FIELDS name to the exact value wanted; only the
+        # offset..offset+limit window of matches is turned into records
+        stop = None if limit is None else offset + limit
+        with self.lock:
+            if not filters:
+                return list(self.columns.records(self.unique[offset:stop]))
+            postings = [self.by_field[RECORD_KEY_FIELDS.index(f)].get(v, []) for f, v in filters.items()]
+            postings.sort(key=len)
+            wanted = [(RECORD_KEY_FIELDS.index(f), v) for f, v in filters.items()]
+            keys = (key for key in postings[0] if all(key[i] == v for i, v in wanted))
+            return [self.columns.record(self.by_key[key]) for key in islice(keys, offset, stop)]
+
+    def count(self, filters=None):
+        with self.lock:
+            if not filters:
+                return len(self.unique)
+            postings = [self.by_field[RECORD_KEY_FIELDS.index(f)].get(v, []) for f, v in filters.items()]
+            postings.sort(key=len)
+            wanted = [(RECORD_KEY_FIELDS.index(f), v) for f, v in filters.items()]
+            return sum(1 for key in postings[0] if all(key[i] == v for i, v in wanted))
+
+    def page(self, column=None, descending=False, offset=0, limit=50):
+        # One window of records in browser order; sort keys are computed once per column
+        with self.lock:
+            if not column:
+                rows = self.unique[::-1] if descending else self.unique
+                return list(self.columns.records(rows[offset:offset + limit]))
+            order = self.orders.get((column, descending))
+            if order is None:
+                keys = self.sort_keys.get(column)
+                if keys is None:
+                    keys = self.sort_keys[column] = self.columns.sort_keys(column, self.unique)
+                order = sorted(range(len(keys)), key=keys.__getitem__, reverse=descending)
+                self.orders[(column, descending)] = order
+            return list(self.columns.records(self.unique[i] for i in order[offset:offset + limit]))
+
+    def readings(self, auth, start=None, end=None):
+        # All records for one Auth whose billing period falls inside [start, end] (date strings)
+        lo = date_ordinal(start) if start else None
+        hi = date_ordinal(end) if end else None
+        with self.lock:
+            columns = self.columns
+            ordinals = columns.date_ordinals
+            from_ids, to_ids = columns.date_ids["Billing Period From"], columns.date_ids["Billing Period Up To"]
+            result = []
+            for key in self.by_field[1].get(auth, []):
+                row = self.by_key[key]
+                f_ord = ordinals[from_ids[row]] if from_ids[row] != MISSING else 0
+                t_ord = ordinals[to_ids[row]] if to_ids[row] != MISSING else 0
+                if lo is not None and (not f_ord or f_ord < lo):
+                    continue
+                if hi is not None and (not t_ord or t_ord > hi):
+                    continue
+                result.append(columns.record(row))
+            return result
+
+    def export_rows(self, fields, filters=None, start=None, end=None):
+        # Streams the text of fields for matching records: the working set, then archived periods
+        # not saved again since. Only the row numbers are copied under the lock.
+        lo = date_ordinal(start) if start else None
+        hi = date_ordinal(end) if end else None
+        with self.lock:
+            columns, by_key = self.columns, self.by_key
+            if filters:
+                postings = sorted((self.by_field[RECORD_KEY_FIELDS.index(f)].get(v, []) for f, v in filters.items()),
+                                  key=len)
+                wanted = [(RECORD_KEY_FIELDS.index(f), v) for f, v in filters.items()]
+                rows = array("i", (by_key[key] for key in postings[0] if all(key[i] == v for i, v in wanted)))
+            else:
+                rows = array("i", self.unique)
+        ordinals = columns.date_ordinals
+        from_ids, to_ids = columns.date_ids["Billing Period From"], columns.date_ids["Billing Period Up To"]
+        text = columns.text
+        for row in rows:
+            if lo is not None or hi is not None:
+                f_ord = ordinals[from_ids[row]] if from_ids[row] != MISSING else 0
+                t_ord = ordinals[to_ids[row]] if to_ids[row] != MISSING else 0
+                if not period_within(f_ord, t_ord, lo, hi):
+                    continue
+            yield [text(row, f) or "" for f in fields]
+        if self.store.archive is not None:
+            yield from self.store.archive.export_rows(fields, filters, lo, hi, by_key.__contains__)
+
+
+# --- Optional SQLite Storage Engine ---
+SUBMETER_DB = "submeter.db"
+SQLITE_BATCH_SIZE = 5000
+SQLITE_KEY_COLUMNS = ("file_key", "auth", "period_from", "period_to")
+SQLITE_NUMBER_COLUMNS = {  # parsed sort values of the number fields, indexed for browser paging
+    "Previous kWh Reading": "previous_kwh",
+    "Current kWh Reading": "current_kwh",
+    "Total Actual Consumption (kWh)": "consumption_kwh",
+    "Total Amount": "amount",
+}
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sub_meter (
+    id INTEGER PRIMARY KEY,
+    file_key TEXT NOT NULL,
+    auth TEXT NOT NULL,
+    period_from TEXT NOT NULL,
+    period_to TEXT NOT NULL,
+    from_ordinal INTEGER,
+    to_ordinal INTEGER,
+    previous_kwh REAL,
+    current_kwh REAL,
+    consumption_kwh REAL,
+    amount REAL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sub_meter_auth_period ON sub_meter (auth, from_ordinal, to_ordinal);
+CREATE INDEX IF NOT EXISTS ix_sub_meter_period_from ON sub_meter (period_from);
+CREATE INDEX IF NOT EXISTS ix_sub_meter_period_to ON sub_meter (period_to);
+CREATE INDEX IF NOT EXISTS ix_sub_meter_from_ordinal ON sub_meter (from_ordinal, to_ordinal);
+"""
+
+
+def sqlite_row(rec):
+    key = record_key(rec)
+    sub = rec.get("Sub_Meter", {})
+    numbers = tuple(None if sub.get(field) is None else parse_reading(sub[field]) for field in SQLITE_NUMBER_COLUMNS)
+    return key + (date_ordinal(key[2]), date_ordinal(key[3])) + numbers + (json.dumps(rec, separators=(",", ":")),)
+
+
+class SqliteRecordIndex:
+    # Same interface as RecordIndex, answered by indexed queries against submeter.db
+    def __init__(self, db_path=SUBMETER_DB, archive=None):
+        self.db_path = db_path
+        self.archive = archive  # SubmeterArchive of the JSON store, for periods archived before migrating
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ux_sub_meter_key'").fetchone():
+            # One-time dedup of databases migrated before saves became upserts: keep the latest
+            with self.conn:
+                self.conn.execute("DELETE FROM sub_meter WHERE id NOT IN (SELECT MAX(id) FROM sub_meter"
+                                  " GROUP BY file_key, auth, period_from, period_to)")
+                self.conn.execute("DROP INDEX IF EXISTS ix_sub_meter_key")
+                self.conn.execute("CREATE UNIQUE INDEX ux_sub_meter_key ON sub_meter"
+                                  " (file_key, auth, period_from, period_to)")
+        have = {row[1] for row in self.conn.execute("PRAGMA table_info(sub_meter)")}
+        with self.conn:
+            for field, col in SQLITE_NUMBER_COLUMNS.items():
+                if col not in have:
+                    # Databases created before the number columns: filled once from the records
+                    self.conn.execute(f"ALTER TABLE sub_meter ADD COLUMN {col} REAL")
+                    self.conn.execute(f"UPDATE sub_meter SET {col} = CAST(REPLACE(json_extract(record,"
+                                      f" '$.Sub_Meter.\"{field}\"'), ',', '') AS REAL)")
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS ix_sub_meter_{col} ON sub_meter ({col})")
+        self.search = {}
+        self.rollups = None
+
+    def refresh(self):
+        pass  # every query reads the database directly
+
+    def suggest(self, field, text, limit=SEARCH_LIMIT):
+        # The type-ahead index is built from one DISTINCT query and then kept up by append_many
+        with self.lock:
+            search = self.search.get(field)
+            if search is None:
+                search = self.search[field] = KeySearch()
+                for value in self.values(field):
+                    search.add(value, bulk=True)
+                search.finish_bulk()
+            return search.search(text, limit)
+
+    def append_many(self, records):
+        # Upsert on the unique key: a later save replaces the record and keeps its id
+        rows = [sqlite_row(rec) for rec in records]
+        replaced = 0
+        with self.lock, self.conn:
+            latest = {}
+            for rec, row in zip(records, rows):
+                key = row[:4]
+                if key in latest:
+                    old = latest[key]
+                else:
+                    old = self.conn.execute(
+                        "SELECT record FROM sub_meter WHERE file_key = ? AND auth = ? AND period_from = ?"
+                        " AND period_to = ?", key).fetchone()
+                    old = old and json.loads(old[0])
+                if old is not None:
+                    replaced += 1
+                    if self.rollups is not None:
+                        self.rollups.add_record(old, sign=-1)
+                elif self.rollups is not None:
+                    self.rollups.drop_archived(key)
+                if self.rollups is not None:
+                    self.rollups.add_record(rec)
+                latest[key] = rec
+            for i in range(0, len(rows), SQLITE_BATCH_SIZE):
+                self.conn.executemany(
+                    "INSERT INTO sub_meter (file_key, auth, period_from, period_to, from_ordinal, to_ordinal,"
+                    " previous_kwh, current_kwh, consumption_kwh, amount, record)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (file_key, auth, period_from, period_to)"
+                    " DO UPDATE SET from_ordinal = excluded.from_ordinal, to_ordinal = excluded.to_ordinal,"
+                    " previous_kwh = excluded.previous_kwh, current_kwh = excluded.current_kwh,"
+                    " consumption_kwh = excluded.consumption_kwh, amount = excluded.amount,"
+                    " record = excluded.record", rows[i:i + SQLITE_BATCH_SIZE])
+            for field, search in self.search.items():
+                col = RECORD_KEY_FIELDS.index(field)
+                for row in rows:
+                    search.add(row[col])
+        return replaced
+
+    def append(self, rec):
+        return self.append_many([rec]) > 0
+
+    def with_rollups(self, fn):
+        # Rollups come from one scan of the table, then append_many keeps them current
+        with self.lock:
+            if self.rollups is None:
+                self.rollups = ConsumptionRollups()
+                saved = set()
+                for rec in self.find({}):
+                    self.rollups.add_record(rec)
+                    saved.add(record_key(rec))
+                if self.archive is not None:
+                    self.rollups.add_archived(self.archive.rollup_entries(), saved.__contains__)
+            return fn(self.rollups)
+
+    def values(self, field):
+        col = SQLITE_KEY_COLUMNS[RECORD_KEY_FIELDS.index(field)]
+        with self.lock:
+            rows = self.conn.execute(f"SELECT DISTINCT {col} FROM sub_meter WHERE {col} != '' ORDER BY {col}")
+            return [row[0] for row in rows]
+
+    def lookup(self, file_key, auth, bpf, bpu):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT record FROM sub_meter WHERE file_key = ? AND auth = ? AND period_from = ? AND period_to = ?",
+                (file_key, auth, bpf, bpu)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, filters, offset=0, limit=None):
+        where = " AND ".join(f"{SQLITE_KEY_COLUMNS[RECORD_KEY_FIELDS.index(f)]} = ?" for f in filters) or "1"
+        with self.lock:
+            rows = self.conn.execute(f"SELECT record FROM sub_meter WHERE {where} ORDER BY id LIMIT ? OFFSET ?",
+                                     list(filters.values()) + [-1 if limit is None else limit, offset])
+            return [json.loads(row[0]) for row in rows]
+
+    def readings(self, auth, start=None, end=None):
+        sql = "SELECT record FROM sub_meter WHERE auth = ?"
+        params = [auth]
+        if start:
+            sql += " AND from_ordinal >= ?"
+            params.append(date_ordinal(start))
+        if end:
+            sql += " AND to_ordinal <= ?"
+            params.append(date_ordinal(end))
+        with self.lock:
+            rows = self.conn.execute(sql + " ORDER BY from_ordinal, id", params)
+            return [json.loads(row[0]) for row in rows]
+
+    def export_rows(self, fields, filters=None, start=None, end=None):
+        # Own connection: a WAL reader streams the rows without holding the index lock against saves
+        where = [f"{SQLITE_KEY_COLUMNS[RECORD_KEY_FIELDS.index(f)]} = ?" for f in filters or {}]
+        params = list((filters or {}).values())
+        lo = date_ordinal(start) if start else None
+        hi = date_ordinal(end) if end else None
+        if lo is not None:
+            where.append("from_ordinal >= ?")
+            params.append(lo)
+        if hi is not None:
+            where.append("to_ordinal <= ?")
+            params.append(hi)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            sql = f"SELECT record FROM sub_meter WHERE {' AND '.join(where) or '1'} ORDER BY id"
+            for (text,) in conn.execute(sql, params):
+                rec = json.loads(text)
+                yield [record_field(rec, f) for f in fields]
+            if self.archive is not None:
+                is_saved = lambda key: conn.execute(
+                    "SELECT 1 FROM sub_meter WHERE file_key = ? AND auth = ? AND period_from = ? AND period_to = ?",
+                    key).fetchone() is not None
+                yield from self.archive.export_rows(fields, filters, lo, hi, is_saved)
+        finally:
+            conn.close()
+
+    def count(self, filters=None):
+        where = " AND ".join(f"{SQLITE_KEY_COLUMNS[RECORD_KEY_FIELDS.index(f)]} = ?" for f in filters or {}) or "1"
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM sub_meter WHERE {where}",
+                                     list((filters or {}).values())).fetchone()[0]
+
+    def page(self, column=None, descending=False, offset=0, limit=50):
+        kind = BROWSER_COLUMN_KINDS.get(column)
+        if kind == "text":
+            order = SQLITE_KEY_COLUMNS[RECORD_KEY_FIELDS.index(column)]
+        elif kind == "date":
+            order = "from_ordinal" if column == "Billing Period From" else "to_ordinal"
+        elif kind == "number":
+            order = SQLITE_NUMBER_COLUMNS[column]
+        else:
+            order = "id"
+        direction = "DESC" if descending else "ASC"  # ties run with the sort too, so one index serves both
+        with self.lock:
+            rows = self.conn.execute(f"SELECT record FROM sub_meter ORDER BY {order} {direction}, id {direction}"
+                                     " LIMIT ? OFFSET ?",
+                                     (limit, offset))
+            return [json.loads(row[0]) for row in rows]
+
+
+def migrate_json_to_sqlite(store, db_path=SUBMETER_DB):
+    # One-shot import of the archive, submeter.json and the journal into a fresh SQLite database
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists")
+    index = SqliteRecordIndex(db_path, store.archive)
+    if store.archive is not None:
+        for chunk in iter_chunks(store.archive.iter_records(), SQLITE_BATCH_SIZE):
+            index.append_many(chunk)
+    index.append_many(store.load())  # after the archive, so a period saved again replaces it
+    return index, index.count()
+
+
+def open_submeter_index(store):
+    # submeter.db takes over as the storage engine once it has been migrated
+    if os.path.exists(SUBMETER_DB):
+        return SqliteRecordIndex(SUBMETER_DB, store.archive)
+    return RecordIndex(store)
+
+
+class LazyIndex:
+    # Opens the storage engine on first use, so importing the module or showing the
+    # Bill Detail tab never touches submeter.json/submeter.db
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.index = None
+
+    def get(self):
+        with self.lock:
+            if self.index is None:
+                self.index = open_submeter_index(self.store)
+            return self.index
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+submeter_archive = SubmeterArchive()
+submeter_store = SubmeterStore(archive=submeter_archive)
+submeter_index = LazyIndex(submeter_store)
+
+
+# --- Reading History File ---
+# Fixed-width binary copy of every reading, sorted by Auth then period, for audit range
+# queries without parsing submeter.json. submeter.json stays the interchange format:
+# the file is built from it and can be turned back into it.
+READING_HISTORY = "submeter_history.bin"
+HISTORY_MAGIC = b"MHIST\x00\x01\x00"
+HISTORY_HEADER = struct.Struct("<8sIIQQQ")  # magic, version, record size, count, blocks offset, strings offset
+HISTORY_DATA_OFFSET = 64
+HISTORY_RECORD = struct.Struct("<iiii4d4b4x")  # auth, file key, from, to, 4 numbers, 4 number styles
+HISTORY_DTYPE = None  # structured dtype of HISTORY_RECORD, set by load_numpy
+
+
+def load_numpy():
+    # NumPy costs a noticeable share of startup: CLI commands load it up front, the GUI
+    # in the background once the window is interactive. Without it the pure-Python paths run.
+    global np, HISTORY_DTYPE
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        HISTORY_DTYPE = numpy.dtype([
+            ("auth", "<i4"), ("file_key", "<i4"), ("from", "<i4"), ("to", "<i4"),
+            ("previous", "<f8"), ("current", "<f8"), ("consumption", "<f8"), ("amount", "<f8"),
+            ("styles", "i1", 4), ("pad", "V4")])
+        _rate_plan_cache.clear()  # compiled with plain lists
+        np = numpy
+    return np
+
+
+def history_date(ordinal):
+    return dt.fromordinal(ordinal).strftime("%d-%b-%Y") if ordinal > 0 else ""
+
+
+def history_number(value, style):
+    # Free text that was not a number is kept only as its parsed value
+    if style == STYLE_EMPTY:
+        return ""
+    if style < 0:
+        style = 0 if value == int(value) else 2
+    return NUMBER_STYLES[style].format(value)
+
+
+def write_reading_history(records, path=READING_HISTORY):
+    columns = RecordColumns()
+    columns.extend(records)
+    n = len(columns)
+    auth_names = columns.text_pools["Auth"].values
+    auths = sorted(set(auth_names) | ({""} if MISSING in columns.text_ids["Auth"] else set()))
+    rank = {name: i for i, name in enumerate(auths)}
+    auth_rank = array("i", (rank[name] for name in auth_names))
+    auth_ids = array("i", (auth_rank[i] if i != MISSING else rank[""] for i in columns.text_ids["Auth"]))
+    froms, tos = columns.column("Billing Period From"), columns.column("Billing Period Up To")
+    numbers = [columns.column(f) for f in NUMBER_FIELDS]
+    styles = [columns.styles[f] for f in NUMBER_FIELDS]
+    if np is not None:
+        rows = np.zeros(n, HISTORY_DTYPE)
+        rows["auth"] = np.frombuffer(auth_ids, np.int32) if n else 0
+        rows["file_key"] = columns.column("FileKey")
+        rows["from"], rows["to"] = froms, tos
+        for name, values, style in zip(("previous", "current", "consumption", "amount"), numbers, styles):
+            rows[name] = values
+        rows["styles"] = np.stack([np.frombuffer(s, np.int8) if n else np.zeros(0, np.int8) for s in styles], axis=1)
+        rows = rows[np.lexsort((rows["to"], rows["from"], rows["auth"]))]
+        blocks = np.searchsorted(rows["auth"], np.arange(len(auths) + 1)).astype("<i8").tobytes()
+        data = rows.tobytes()
+    else:
+        rows = sorted(zip(auth_ids, columns.column("FileKey"), froms, tos, *numbers, *styles),
+                      key=lambda row: (row[0], row[2], row[3]))
+        data = b"".join(HISTORY_RECORD.pack(*row) for row in rows)
+        starts = [bisect.bisect_left(rows, (i,)) for i in range(len(auths) + 1)]
+        blocks = struct.pack(f"<{len(starts)}q", *starts)
+    strings = json.dumps({"auths": auths, "file_keys": columns.text_pools["FileKey"].values}).encode("utf-8")
+    blocks_offset = HISTORY_DATA_OFFSET + len(data)
+    header = HISTORY_HEADER.pack(HISTORY_MAGIC, 1, HISTORY_RECORD.size, n, blocks_offset, blocks_offset + len(blocks))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header.ljust(HISTORY_DATA_OFFSET, b"\0"))
+        f.write(data)
+        f.write(blocks)
+        f.write(strings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return n
+
+
+class ReadingHistory:
+    # Read-only view of a history file through mmap: the Auth block table and the string
+    # tables are loaded, the readings themselves are only paged in when queried.
+    def __init__(self, path=READING_HISTORY):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, record_size, self.count, blocks_offset, strings_offset = HISTORY_HEADER.unpack_from(self.mm)
+        if magic != HISTORY_MAGIC or record_size != HISTORY_RECORD.size:
+            self.mm.close()
+            raise ValueError(f"{path} is not a reading history file")
+        strings = json.loads(self.mm[strings_offset:].decode("utf-8"))
+        self.auths, self.file_keys = strings["auths"], strings["file_keys"]
+        self.blocks = struct.unpack_from(f"<{len(self.auths) + 1}q", self.mm, blocks_offset)
+        self.rows = None
+        if np is not None:
+            self.rows = np.frombuffer(self.mm, HISTORY_DTYPE, self.count, HISTORY_DATA_OFFSET)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.rows = None
+        try:
+            self.mm.close()
+        except BufferError:
+            pass  # a query() view is still alive; the map closes when it is collected
+
+    def from_ordinal(self, row):
+        return struct.unpack_from("<i", self.mm, HISTORY_DATA_OFFSET + row * HISTORY_RECORD.size + 8)[0]
+
+    def row_range(self, auth, start=None, end=None):
+        # Rows of one Auth whose period starts within [start, end] (date strings)
+        i = bisect.bisect_left(self.auths, auth)
+        if i == len(self.auths) or self.auths[i] != auth:
+            return 0, 0
+        lo, hi = self.blocks[i], self.blocks[i + 1]
+        start, end = date_ordinal(start) if start else None, date_ordinal(end) if end else None
+        if self.rows is not None:
+            froms = self.rows["from"][lo:hi]
+            first = lo + (int(np.searchsorted(froms, start, "left")) if start else 0)
+            last = lo + (int(np.searchsorted(froms, end, "right")) if end else hi - lo)
+        else:
+            first = bisect.bisect_left(range(lo, hi), start, key=self.from_ordinal) + lo if start else lo
+            last = bisect.bisect_right(range(lo, hi), end, key=self.from_ordinal) + lo if end else hi
+        return first, max(first, last)
+
+    def query(self, auth, start=None, end=None):
+        # A zero-copy NumPy view of the matching rows (tuples when NumPy is missing)
+        first, last = self.row_range(auth, start, end)
+        if self.rows is not None:
+            return self.rows[first:last]
+        size = HISTORY_RECORD.size
+        offset = HISTORY_DATA_OFFSET + first * size
+        return list(HISTORY_RECORD.iter_unpack(self.mm[offset:offset + (last - first) * size]))
+
+    def record(self, row):
+        # row is a NumPy record or an unpacked HISTORY_RECORD tuple
+        row = tuple(row)
+        styles = row[8] if len(row) == 10 else row[8:12]
+        values = {"Auth": self.auths[row[0]], "Billing Period From": history_date(row[2]),
+                  "Billing Period Up To": history_date(row[3])}
+        for field, value, style in zip(NUMBER_FIELDS, row[4:8], styles):
+            if style != STYLE_MISSING:
+                values[field] = history_number(float(value), int(style))
+        sub = {field: values[field] for field in SUB_METER_FIELDS if field in values}
+        return {"FileKey": self.file_keys[row[1]] if row[1] != MISSING else "", "Sub_Meter": sub}
+
+    def records(self, auth=None, start=None, end=None):
+        # submeter.json-shaped records for one Auth, or for the whole file
+        if auth is not None:
+            rows = self.query(auth, start, end)
+        elif self.rows is not None:
+            rows = self.rows
+        else:
+            rows = HISTORY_RECORD.iter_unpack(self.mm[HISTORY_DATA_OFFSET:HISTORY_DATA_OFFSET + self.count *
+                                                      HISTORY_RECORD.size])
+        for row in rows:
+            yield self.record(row)
+
+
+# --- Rate Components ---
+RATE_TABLE_HEADER = "Rate Components"
+RATE_MATCH_TOLERANCE = 0.01  # fraction of the base a run of components may be off by
+_rate_plan_cache = {}
+
+
+def parse_amount(text):
+    try:
+        return float(str(text).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def load_rate_components(fn):
+    # (name, base, unit, price, amount) rows of the Rate Components table, TOTAL included
+    rows = []
+    in_table = False
+    with open(fn, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not any(cell.strip() for cell in row):
+                continue
+            if row[0].strip() == RATE_TABLE_HEADER:
+                in_table = True
+                continue
+            if in_table:
+                name, base, unit, price, amount = (row + [""] * 5)[:5]
+                rows.append((name.strip(), parse_amount(base), unit.strip().lower(),
+                             parse_amount(price), parse_amount(amount)))
+    return rows
+
+
+class RatePlan:
+    # Every component is affine in consumption (amount = a * kWh + b), so percentage rows are
+    # resolved to their base components once here and a bill is a single vectorized pass.
+    def __init__(self, names, kinds, a, b, reference_kwh, reference_total):
+        self.names = names
+        self.kinds = kinds
+        self.a = a
+        self.b = b
+        self.billed = [0.0 if kind == "subtotal" else 1.0 for kind in kinds]
+        self.reference_kwh = reference_kwh
+        self.reference_total = reference_total
+        if np is not None:
+            self.a = np.array(a, dtype=np.float64)
+            self.b = np.array(b, dtype=np.float64)
+            self.billed = np.array(self.billed, dtype=np.float64)
+
+    def lines(self, kwh):
+        # Rounded component amounts: one row per consumption value (or one list for a scalar)
+        if np is not None:
+            return np.round(np.multiply.outer(np.asarray(kwh, dtype=np.float64), self.a) + self.b, 2)
+        if isinstance(kwh, (int, float)):
+            return [round(a * kwh + b, 2) for a, b in zip(self.a, self.b)]
+        return [self.lines(k) for k in kwh]
+
+    def totals(self, kwh):
+        # Subtotal rows such as VAT Sales are shown but not added again
+        lines = self.lines(kwh)
+        if np is not None:
+            return np.round(lines @ self.billed, 2)
+        if isinstance(kwh, (int, float)):
+            return round(sum(x * w for x, w in zip(lines, self.billed)), 2)
+        return [round(sum(x * w for x, w in zip(row, self.billed)), 2) for row in lines]
+
+    def tenant(self):
+        # The plan sub-meters are billed on: without the main-bill-only lines (deposit, TOTAL Adjustment)
+        keep = [i for i, kind in enumerate(self.kinds) if kind != "main"]
+        a, b = list(self.a), list(self.b)
+        total = self.reference_total
+        if total is not None:
+            total = round(total - sum(round(b[i], 2) for i, kind in enumerate(self.kinds) if kind == "main"), 2)
+        return RatePlan([self.names[i] for i in keep], [self.kinds[i] for i in keep], [a[i] for i in keep],
+                        [b[i] for i in keep], self.reference_kwh, total)
+
+    def bill(self, kwh):
+        lines = self.lines(float(kwh))
+        amounts = lines.tolist() if np is not None else lines
+        return list(zip(self.names, amounts)), round(sum(x * w for x, w in zip(amounts, self.billed)), 2)
+
+
+def matching_run(target, amounts, min_len=1, tolerance=0.01):
+    # Contiguous run of amounts whose sum is closest to target, as a (start, stop) slice
+    best, best_diff = None, None
+    for i in range(len(amounts)):
+        total = 0.0
+        for j in range(i, len(amounts)):
+            total += amounts[j]
+            if j - i + 1 < min_len:
+                continue
+            diff = abs(total - target)
+            if best_diff is None or diff < best_diff - 1e-9:
+                best, best_diff = (i, j + 1), diff
+    if best is None or best_diff > tolerance:
+        return None
+    return best
+
+
+def compile_rate_plan(rows):
+    table = [r for r in rows if r[0].upper() != "TOTAL"]
+    total_row = next((r for r in rows if r[0].upper() == "TOTAL"), None)
+    kwh_bases = [r[1] for r in table if r[2] == "kwh" and r[1]]
+    ref_kwh = max(set(kwh_bases), key=kwh_bases.count) if kwh_bases else 0.0
+    names, kinds, a, b, refs = [], [], [], [], []
+    prior = []  # indexes of the per-kWh/per-month components a percentage row may build on
+    for name, base, unit, price, amount in table:
+        amount = amount or 0.0
+        run = None
+        if price is None and amount:
+            billed = [i for i, kind in enumerate(kinds) if kind != "subtotal"]
+            run = matching_run(amount, [refs[i] for i in billed], min_len=2)
+        if run:
+            kind = "subtotal"
+            deps = billed[run[0]:run[1]]
+            ca, cb = sum(a[i] for i in deps), sum(b[i] for i in deps)
+        elif unit == "kwh":
+            kind, ca, cb = "kWh", (amount / base if base else 0.0), 0.0
+        elif "deposit" in name.lower():
+            kind, ca, cb = "main", 0.0, amount  # the account holder's deposit, not a charge for tenants
+        elif unit == "mo" or (base == 1 and not unit):
+            kind, ca, cb = "month", 0.0, amount
+        elif base is None:
+            kind = "kWh"  # amount-only rows (FiT-All, Non-VAT) scale with consumption
+            ca, cb = (amount / ref_kwh, 0.0) if ref_kwh else (0.0, amount)
+        else:
+            kind, ca, cb = "percent", 0.0, 0.0
+            deps = []
+            if base:
+                run = matching_run(base, [refs[i] for i in prior],
+                                   tolerance=max(0.01, abs(base) * RATE_MATCH_TOLERANCE))
+                deps = prior[run[0]:run[1]] if run else prior
+            dep_total = sum(refs[i] for i in deps)
+            if dep_total:
+                ratio = amount / dep_total
+                ca = ratio * sum(a[i] for i in deps)
+                cb = ratio * sum(b[i] for i in deps)
+        if kind in ("kWh", "month"):
+            prior.append(len(names))
+        names.append(name)
+        kinds.append(kind)
+        a.append(ca)
+        b.append(cb)
+        refs.append(ca * ref_kwh + cb)
+    total = total_row[4] if total_row else None
+    if total is not None:
+        reconcile_rate_plan(table, names, kinds, a, b, refs, ref_kwh, total)
+    return RatePlan(names, kinds, a, b, ref_kwh, total)
+
+
+def reconcile_rate_plan(table, names, kinds, a, b, refs, ref_kwh, total):
+    # The compiled lines must reproduce the bill's TOTAL at the reference kWh
+    def gap():
+        return round(sum(round(r, 2) for r, kind in zip(refs, kinds) if kind != "subtotal") - total, 2)
+
+    # A summary row with no base or price (e.g. Non-VAT) is not charged again when the TOTAL leaves it out
+    if gap():
+        summaries = [i for i, row in enumerate(table) if row[1] is None and row[3] is None and refs[i]
+                     and kinds[i] != "subtotal"
+                     and abs(refs[i] - gap()) <= max(0.01, abs(refs[i]) * RATE_MATCH_TOLERANCE)]
+        if summaries:
+            kinds[summaries[-1]] = "subtotal"
+    diff = gap()
+    if abs(diff) > max(0.01, abs(total) * RATE_MATCH_TOLERANCE):
+        raise ValueError(f"Rate components add up to {total + diff:,.2f} at {ref_kwh:g} kWh "
+                         f"but the bill TOTAL is {total:,.2f}")
+    if diff:
+        # stderr: bill --components and the benchmark write their JSON to stdout
+        print(f"Rate components add up to {total + diff:,.2f} at {ref_kwh:g} kWh, bill TOTAL is {total:,.2f}; "
+              f"billing the {-diff:,.2f} difference as a TOTAL Adjustment", file=sys.stderr)
+        names.append("TOTAL Adjustment")
+        kinds.append("main")  # rounding on the main bill, not passed on to tenants
+        a.append(0.0)
+        b.append(-diff)
+        refs.append(-diff)
+
+
+def load_rate_plan(fn="bill_detail.csv"):
+    # The tenant plan, compiled once per rate file and reused until the file changes
+    st = os.stat(fn)
+    key = (os.path.abspath(fn), st.st_mtime_ns, st.st_size)
+    plan = _rate_plan_cache.get(key)
+    if plan is None:
+        plan = _rate_plan_cache[key] = compile_rate_plan(load_rate_components(fn)).tenant()
+    return plan
+
+
+# --- Headless Batch Billing ---
+BATCH_CHUNK_SIZE = 65536
+READING_COLUMNS = (
+    ("FileKey", ("FileKey", "file_key")),
+    ("Auth", ("Auth", "auth", "Authorized")),
+    ("Billing Period From", ("Billing Period From", "from", "period_from")),
+    ("Previous kWh Reading", ("Previous kWh Reading", "previous", "prev")),
+    ("Billing Period Up To", ("Billing Period Up To", "to", "up_to", "period_to")),
+    ("Current kWh Reading", ("Current kWh Reading", "current", "curr")),
+)
+
+
+def parse_reading(text):
+    try:
+        return float(str(text).replace(",", ""))
+    except ValueError:
+        return 0.0
+
+
+def readings_to_floats(values):
+    cleaned = [v.replace(",", "") for v in values]
+    if np is None:
+        return [parse_reading(v) for v in cleaned]
+    try:
+        return np.array(cleaned, dtype=np.float64)
+    except ValueError:
+        return np.array([parse_reading(v) for v in cleaned], dtype=np.float64)
+
+
+def price_consumption(cons, rate):
+    # cons is a list, or an array when NumPy is available; rate is PHP per kWh or a RatePlan
+    if isinstance(rate, RatePlan):
+        return rate.totals(cons)
+    return [c * rate for c in cons] if np is None else cons * rate
+
+
+def compute_sub_bills(prev, curr, rate):
+    # Same formula as update_sub, for whole columns at once; rate may also be a RatePlan
+    cons = [c - p for p, c in zip(prev, curr)] if np is None else np.subtract(curr, prev)
+    return cons, price_consumption(cons, rate)
+
+
+def reading_column_map(names):
+    names = [n.strip() for n in names]
+    return [next((names.index(a) for a in aliases if a in names), None) for _, aliases in READING_COLUMNS]
+
+
+def reading_row(row):
+    # (FileKey, Auth, From, Previous, Up To, Current) from a reading dict or a submeter.json record
+    if "Sub_Meter" in row:
+        row = dict(row["Sub_Meter"], FileKey=row.get("FileKey", ""))
+    return tuple(str(next((row[a] for a in aliases if a in row), "")) for _, aliases in READING_COLUMNS)
+
+
+def iter_reading_rows(fn):
+    # Yields (FileKey, Auth, From, Previous, Up To, Current) string tuples
+    with open(fn, newline="", encoding="utf-8") as f:
+        if fn.lower().endswith(".json"):
+            data = json.load(f)  # a submeter.json list (or one record), indented as the app saves it
+            for rec in data if isinstance(data, list) else [data]:
+                yield reading_row(rec)
+        elif fn.lower().endswith(".jsonl"):
+            for line in f:
+                if not line.strip():
+                    continue
+                yield reading_row(json.loads(line))
+        else:
+            reader = csv.reader(f)
+            cols = reading_column_map(next(reader, []))
+            for row in reader:
+                if not any(row):
+                    continue
+                n = len(row)
+                yield tuple(row[i].strip() if i is not None and i < n else "" for i in cols)
+
+
+def iter_chunks(rows, chunk_size=BATCH_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bill_readings(rows, rate, file_key="", chunk_size=BATCH_CHUNK_SIZE):
+    # Streams submeter.json-shaped records, billing chunk_size rows per vectorized pass
+    for chunk in iter_chunks(rows, chunk_size):
+        yield from bill_chunk(chunk, rate, file_key)
+
+
+def bill_chunk(chunk, rate, file_key):
+    prev = readings_to_floats([row[3] for row in chunk])
+    curr = readings_to_floats([row[5] for row in chunk])
+    cons, amounts = compute_sub_bills(prev, curr, rate)
+    if np is not None:
+        cons, amounts = cons.tolist(), amounts.tolist()
+    for row, kwh, amt in zip(chunk, cons, amounts):
+        yield reading_record(row, kwh, amt, file_key)
+
+
+def reading_record(row, kwh, amount, file_key=""):
+    fk, auth, bpf, p, bpu, c = row
+    return {
+        "FileKey": fk or file_key,
+        "Sub_Meter": {
+            "Auth": auth,
+            "Billing Period From": bpf,
+            "Previous kWh Reading": p,
+            "Billing Period Up To": bpu,
+            "Current kWh Reading": c,
+            "Total Actual Consumption (kWh)": f"{kwh:.2f}",
+            "Total Amount": f"{amount:.2f}"
+        }
+    }
+
+
+def bill_file_rate(fn="bill_detail.csv"):
+    left, _, _ = load_data(fn)
+    return parse_reading(left.get("Rate This Month", ""))
+
+
+def billing_rate(args):
+    # --components, else --rate, else Rate This Month of --bill; a blank rate is an error, not 0/kWh
+    if args.components:
+        return load_rate_plan(args.bill)
+    if args.rate is not None:
+        return args.rate
+    rate = bill_file_rate(args.bill)
+    if not rate:
+        raise ValueError(f"No Rate This Month in {args.bill}; pass --rate or --components")
+    return rate
+
+
+def normalized_row(row):
+    # Period dates in the DD-Mon-YYYY form the GUI saves, so both write the same record keys
+    fk, auth, bpf, p, bpu, c = row
+    return fk, auth, bill_date_text(bpf) or bpf, p, bill_date_text(bpu) or bpu, c
+
+
+def record_problem(rec):
+    # Why a billed record must not be saved, or None
+    sub = rec["Sub_Meter"]
+    for field in ("Billing Period From", "Billing Period Up To"):
+        if not date_ordinal(sub[field]):
+            return f"{field} is not a date: {sub[field]!r}"
+    kwh = parse_reading(sub["Total Actual Consumption (kWh)"])
+    if kwh < 0:
+        return f"negative consumption ({kwh:,.2f} kWh); check the readings or a meter rollover"
+    return None
+
+
+def run_batch_billing(args):
+    try:
+        rate = billing_rate(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    records = bill_readings(map(normalized_row, iter_reading_rows(args.input)), rate, args.file_key)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    pending = []
+    count = rejected = 0
+    try:
+        for rec in records:
+            out.write(encode(rec) + "\n")
+            count += 1
+            if args.save:
+                problem = record_problem(rec)
+                if problem:
+                    rejected += 1
+                    print(f"Not saved: reading {count} ({rec['Sub_Meter']['Auth']}): {problem}", file=sys.stderr)
+                    continue
+                pending.append(rec)
+                if len(pending) >= BATCH_CHUNK_SIZE:
+                    submeter_index.append_many(pending)
+                    pending = []
+        if pending:
+            submeter_index.append_many(pending)
+    except BrokenPipeError:
+        pass  # output piped into head/more
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.components:
+        print(f"Billed {count} readings from the rate components in {args.bill}", file=sys.stderr)
+    else:
+        print(f"Billed {count} readings at {rate:,.4f}/kWh", file=sys.stderr)
+    if rejected:
+        print(f"{rejected} reading(s) were not saved", file=sys.stderr)
+        return 1
+    return 0
+
+
+# --- Streaming Reading Import ---
+ANOMALIES = ("invalid date", "invalid reading", "negative consumption", "meter rollover", "period overlap",
+             "outlier kWh")
+BAD_DATE, BAD_READING, NEGATIVE, ROLLOVER, OVERLAP, OUTLIER = (1 << i for i in range(len(ANOMALIES)))
+ROLLOVER_FRACTION = 0.9  # a drop is a rollover when the previous reading was this close to the dial limit
+OUTLIER_MIN_HISTORY = 3  # accepted readings of a meter before its kWh are judged
+OUTLIER_Z = 4.0  # spreads away from the meter's mean kWh
+OUTLIER_MIN_SPREAD = 0.25  # fraction of the mean used as the spread of very steady meters
+
+
+def anomaly_names(mask):
+    return [name for i, name in enumerate(ANOMALIES) if mask >> i & 1]
+
+
+def reading_values(values):
+    # Like readings_to_floats, but blank or unparsable readings become NaN instead of 0
+    def one(v):
+        try:
+            return float(v.replace(",", ""))
+        except ValueError:
+            return float("nan")
+    if np is None:
+        return [one(v) for v in values]
+    try:
+        return np.array([v.replace(",", "") for v in values], dtype=np.float64)
+    except ValueError:
+        return np.array([one(v) for v in values], dtype=np.float64)
+
+
+class ReadingChecker:
+    # Carries per-meter state between chunks (kWh count/mean/M2 and the latest period end),
+    # so memory grows with the number of meters, not the number of readings
+    def __init__(self):
+        self.slots = {}  # Auth -> state index
+        self.count = []
+        self.mean = []
+        self.m2 = []
+        self.last_to = []
+
+    def slot_ids(self, auths):
+        slots = self.slots
+        ids = []
+        for auth in auths:
+            sid = slots.get(auth)
+            if sid is None:
+                sid = slots[auth] = len(self.count)
+                self.count.append(0)
+                self.mean.append(0.0)
+                self.m2.append(0.0)
+                self.last_to.append(0)
+            ids.append(sid)
+        return ids
+
+    def check(self, rows):
+        # rows are (FileKey, Auth, From, Previous, Up To, Current); returns kWh and anomaly masks.
+        # Each reading is judged against the meter's other readings: its history plus the rest of this chunk.
+        ids = self.slot_ids([row[1] for row in rows])
+        from_ord = [date_ordinal(row[2]) or 0 for row in rows]
+        to_ord = [date_ordinal(row[4]) or 0 for row in rows]
+        prev = reading_values([row[3] for row in rows])
+        curr = reading_values([row[5] for row in rows])
+        if np is None:
+            return self.check_rows(ids, from_ord, to_ord, prev, curr)
+        ids = np.array(ids, dtype=np.int64)
+        from_ord = np.array(from_ord, dtype=np.int64)
+        to_ord = np.array(to_ord, dtype=np.int64)
+        masks = np.zeros(len(rows), dtype=np.int64)
+        bad_date = (from_ord == 0) | (to_ord < from_ord)
+        masks[bad_date] |= BAD_DATE
+        to_ord[bad_date] = 0
+        bad = np.isnan(prev) | np.isnan(curr) | (prev < 0) | (curr < 0)
+        masks[bad] |= BAD_READING
+        cons = curr - prev
+        drop = ~bad & (cons < 0)
+        wrap = 10.0 ** (np.floor(np.log10(np.maximum(prev, 1.0))) + 1)
+        rolled = drop & (prev >= ROLLOVER_FRACTION * wrap)
+        cons = np.where(rolled, cons + wrap, cons)
+        masks[rolled] |= ROLLOVER
+        masks[drop & ~rolled] |= NEGATIVE
+
+        # Overlaps: sort by meter then start date and compare each start with the end before it
+        order = np.lexsort((from_ord, ids))
+        s_ids, s_to = ids[order], to_ord[order]
+        last_to = np.array(self.last_to, dtype=np.int64)
+        before = last_to[s_ids]
+        before[1:] = np.where(s_ids[1:] == s_ids[:-1], s_to[:-1], before[1:])
+        s_from = from_ord[order]
+        masks[order[(s_from > 0) & (s_from <= before)]] |= OVERLAP
+        np.maximum.at(last_to, ids, to_ord)
+
+        count, mean, m2 = (np.array(x, dtype=np.float64) for x in (self.count, self.mean, self.m2))
+        size = len(count)
+        valid = (masks & (BAD_DATE | BAD_READING | NEGATIVE)) == 0
+        x = np.where(valid, cons, 0.0)
+        v_ids, v_cons = ids[valid], cons[valid]
+        total_n = count + np.bincount(v_ids, minlength=size)
+        total_s = count * mean + np.bincount(v_ids, weights=v_cons, minlength=size)
+        total_q = m2 + count * mean ** 2 + np.bincount(v_ids, weights=v_cons ** 2, minlength=size)
+        n = total_n[ids] - 1
+        mu = (total_s[ids] - x) / np.maximum(n, 1)
+        var = np.maximum(total_q[ids] - x ** 2 - n * mu ** 2, 0.0) / np.maximum(n - 1, 1)
+        spread = np.maximum(np.maximum(np.sqrt(var), OUTLIER_MIN_SPREAD * mu), 1.0)
+        outlier = valid & (n >= OUTLIER_MIN_HISTORY) & (np.abs(x - mu) > OUTLIER_Z * spread)
+        masks[outlier] |= OUTLIER
+
+        # Fold the accepted kWh into the running statistics (pairwise mean/M2 merge per meter)
+        keep = valid & ~outlier
+        k_ids, k_cons = ids[keep], cons[keep]
+        c_n = np.bincount(k_ids, minlength=size).astype(np.float64)
+        has = c_n > 0
+        c_mean = np.divide(np.bincount(k_ids, weights=k_cons, minlength=size), c_n,
+                           out=np.zeros(size), where=has)
+        c_m2 = np.bincount(k_ids, weights=(k_cons - c_mean[k_ids]) ** 2, minlength=size)
+        total = count + c_n
+        delta = np.where(has, c_mean - mean, 0.0)
+        weight = np.divide(c_n, total, out=np.zeros(size), where=has)
+        self.mean = (mean + delta * weight).tolist()
+        self.m2 = (m2 + c_m2 + delta ** 2 * count * weight).tolist()
+        self.count = total.tolist()
+        self.last_to = last_to.tolist()
+        return cons.tolist(), masks.tolist()
+
+    def check_rows(self, ids, from_ord, to_ord, prev, curr):
+        # Same checks one reading at a time, for installs without NumPy
+        cons, masks = [], []
+        for i, (f, t, p, c) in enumerate(zip(from_ord, to_ord, prev, curr)):
+            mask = BAD_DATE if not f or t < f else 0
+            if mask:
+                to_ord[i] = 0
+            kwh = c - p
+            if p != p or c != c or p < 0 or c < 0:
+                mask |= BAD_READING
+            elif kwh < 0:
+                wrap = 10.0 ** len(str(int(p)))
+                if p >= ROLLOVER_FRACTION * wrap:
+                    kwh += wrap
+                    mask |= ROLLOVER
+                else:
+                    mask |= NEGATIVE
+            cons.append(kwh)
+            masks.append(mask)
+        last = None
+        for i in sorted(range(len(ids)), key=lambda i: (ids[i], from_ord[i])):
+            before = to_ord[last] if last is not None and ids[last] == ids[i] else self.last_to[ids[i]]
+            if from_ord[i] and from_ord[i] <= before:
+                masks[i] |= OVERLAP
+            last = i
+        for sid, t in zip(ids, to_ord):
+            self.last_to[sid] = max(self.last_to[sid], t)
+        valid = [not mask & (BAD_DATE | BAD_READING | NEGATIVE) for mask in masks]
+        totals = {}
+        for sid, kwh, ok in zip(ids, cons, valid):
+            if ok:
+                if sid not in totals:
+                    n, mu = self.count[sid], self.mean[sid]
+                    totals[sid] = [n, n * mu, self.m2[sid] + n * mu * mu]
+                t = totals[sid]
+                t[0] += 1
+                t[1] += kwh
+                t[2] += kwh * kwh
+        accepted = []
+        for i, (sid, kwh) in enumerate(zip(ids, cons)):
+            if not valid[i]:
+                continue
+            total_n, total_s, total_q = totals[sid]
+            n = total_n - 1
+            mu = (total_s - kwh) / max(n, 1)
+            var = max(total_q - kwh * kwh - n * mu * mu, 0.0) / max(n - 1, 1)
+            spread = max(var ** 0.5, OUTLIER_MIN_SPREAD * mu, 1.0)
+            if n >= OUTLIER_MIN_HISTORY and abs(kwh - mu) > OUTLIER_Z * spread:
+                masks[i] |= OUTLIER
+            else:
+                accepted.append((sid, kwh))
+        for sid, kwh in accepted:
+            self.count[sid] += 1
+            delta = kwh - self.mean[sid]
+            self.mean[sid] += delta / self.count[sid]
+            self.m2[sid] += delta * (kwh - self.mean[sid])
+        return cons, masks
+
+    def learn(self, rows, chunk_size=BATCH_CHUNK_SIZE):
+        # Seed with readings already on file so the first imported ones have a history. rows is
+        # streamed a chunk at a time; the state is per meter, so their order doesn't matter.
+        for chunk in iter_chunks(rows, chunk_size):
+            self.check(chunk)
+
+
+def import_readings(rows, checker=None, chunk_size=BATCH_CHUNK_SIZE):
+    # Streams (row with DD-Mon-YYYY dates, kWh, anomaly mask); only one chunk is held at a time
+    checker = checker or ReadingChecker()
+    for chunk in iter_chunks(rows, chunk_size):
+        cons, masks = checker.check(chunk)
+        for (fk, auth, bpf, p, bpu, c), kwh, mask in zip(chunk, cons, masks):
+            yield normalized_row((fk, auth, bpf, p, bpu, c)), kwh, mask
+
+
+def run_reading_import(args):
+    if args.save:
+        try:
+            rate = billing_rate(args)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+    checker = ReadingChecker()
+    if not args.no_history:
+        submeter_index.refresh()
+        checker.learn(submeter_index.export_rows([name for name, _ in READING_COLUMNS]), args.chunk_size)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    counts = [0] * len(ANOMALIES)
+    pending = []
+    total = saved = flagged = 0
+
+    def save(batch):
+        kwh = [k for _, k in batch]
+        amounts = price_consumption(kwh if np is None else np.array(kwh, dtype=np.float64), rate)
+        if np is not None:
+            amounts = amounts.tolist()
+        submeter_index.append_many([reading_record(row, k, a, args.file_key)
+                                    for (row, k), a in zip(batch, amounts)])
+        return len(batch)
+
+    try:
+        for row, kwh, mask in import_readings(iter_reading_rows(args.input), checker, args.chunk_size):
+            total += 1
+            if mask:
+                flagged += 1
+                for i in range(len(ANOMALIES)):
+                    counts[i] += mask >> i & 1
+            if mask or not args.flagged_only:
+                out.write(encode({"Line": total, **dict(zip((name for name, _ in READING_COLUMNS), row)),
+                                  "Consumption (kWh)": round(kwh, 2) if kwh == kwh else None,
+                                  "Anomalies": anomaly_names(mask)}) + "\n")
+            if args.save and (not mask & ~ROLLOVER or args.keep_flagged) and not mask & (BAD_DATE | BAD_READING):
+                pending.append((row, kwh))
+                if len(pending) >= args.chunk_size:
+                    saved += save(pending)
+                    pending = []
+        if pending:
+            saved += save(pending)
+    except BrokenPipeError:
+        pass  # output piped into head/more
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    summary = ", ".join(f"{n} {name}" for name, n in zip(ANOMALIES, counts) if n)
+    print(f"Checked {total} readings: {flagged} flagged" + (f" ({summary})" if summary else ""), file=sys.stderr)
+    if args.save:
+        print(f"Saved {saved} readings to the sub-meter store", file=sys.stderr)
+    return 0
+
+
+def read_record_file(fn):
+    # Accepts an old-style submeter.json (list or single record) or a .jsonl journal
+    with open(fn, "r", encoding="utf-8") as jf:
+        text = jf.read()
+    try:
+        data = json.loads(text)
+        return data if isinstance(data, list) else [data]
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def run_record_import(args):
+    # Saved records from another copy of the app; all or nothing, like POST /bill with save
+    try:
+        records = read_record_file(args.input)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read {args.input}: {e}", file=sys.stderr)
+        return 1
+    for n, rec in enumerate(records, 1):
+        if not isinstance(rec, dict) or not isinstance(rec.get("Sub_Meter"), dict):
+            problem = "not a sub-meter record"
+        else:
+            problem = record_problem(rec)
+        if problem:
+            print(f"Record {n}: {problem}; nothing imported", file=sys.stderr)
+            return 1
+    submeter_index.refresh()
+    replaced = submeter_index.append_many(records)
+    print(f"Imported {len(records)} records ({replaced} replaced saved ones)")
+    return 0
+
+
+# --- Record Export ---
+EXPORT_COLUMNS = ("FileKey",) + SUB_METER_FIELDS  # the Sub-Metering form labels, in form order
+EXPORT_FORMATS = {".csv": "csv", ".tsv": "tsv", ".tab": "tsv", ".jsonl": "jsonl"}
+EXPORT_CHUNK_SIZE = 4096
+
+
+def export_columns(names=None):
+    if not names:
+        return EXPORT_COLUMNS
+    unknown = [name for name in names if name not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}. Choose from: {', '.join(EXPORT_COLUMNS)}")
+    return tuple(names)
+
+
+def period_within(f_ord, t_ord, lo, hi):
+    # Same rule as readings(): the whole billing period falls inside [lo, hi]
+    return (lo is None or (f_ord and f_ord >= lo)) and (hi is None or (t_ord and t_ord <= hi))
+
+
+def write_export(rows, fields, f, fmt="csv"):
+    # Header plus rows, written a chunk at a time; returns the number of records
+    count = 0
+    if fmt == "jsonl":
+        encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+        for chunk in iter_chunks(rows, EXPORT_CHUNK_SIZE):
+            f.write("".join(encode(dict(zip(fields, row))) + "\n" for row in chunk))
+            count += len(chunk)
+        return count
+    writer = csv.writer(f, delimiter="\t" if fmt == "tsv" else ",")
+    writer.writerow(fields)
+    for chunk in iter_chunks(rows, EXPORT_CHUNK_SIZE):
+        writer.writerows(chunk)
+        count += len(chunk)
+    return count
+
+
+def export_records(path, index, fields=None, filters=None, start=None, end=None, fmt=None):
+    # Streams the matching records to path ("-" for stdout); the format follows the extension
+    fields = export_columns(fields)
+    for value in (start, end):
+        if value and not date_ordinal(value):
+            raise ValueError(f"Not a date: {value}")
+    fmt = fmt or EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), "csv")
+    index.refresh()
+    rows = index.export_rows(fields, filters or {}, start or None, end or None)
+    if path == "-":
+        return write_export(rows, fields, sys.stdout, fmt)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        count = write_export(rows, fields, f, fmt)
+    os.replace(tmp_path, path)  # never leave a half-written report behind
+    return count
+
+
+def count_export_rows(index, filters=None, start=None, end=None):
+    # How many records export_records would write with the same arguments
+    index.refresh()
+    return sum(1 for _ in index.export_rows((), filters or {}, start or None, end or None))
+
+
+# --- Bill Allocation ---
+ALLOCATION_MODES = ("proportional", "equal", "common")
+
+
+def centavo_split(total, weights):
+    # Splits total into centavo amounts in proportion to weights, adding up to total exactly:
+    # every share is rounded down and the centavos left over go to the largest remainders
+    cents = round(total * 100)
+    if np is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        if not len(weights):
+            return weights
+        wsum = weights.sum()
+        raw = weights / wsum * cents if wsum > 0 else np.full(len(weights), cents / len(weights))
+        base = np.floor(raw)
+        short = int(cents - base.sum())
+        base[np.argsort(base - raw, kind="stable")[:short]] += 1
+        return base / 100
+    if not weights:
+        return []
+    wsum = sum(weights)
+    raw = [w / wsum * cents for w in weights] if wsum > 0 else [cents / len(weights)] * len(weights)
+    base = [float(int(r // 1)) for r in raw]
+    for i in sorted(range(len(raw)), key=lambda i: base[i] - raw[i])[:int(cents - sum(base))]:
+        base[i] += 1
+    return [b / 100 for b in base]
+
+
+def allocate_bill(main_total, main_kwh, sub_kwh, mode="proportional"):
+    # Shares the main bill across the sub-meters of one FileKey. The remainder of the main
+    # meter's kWh over the metered kWh (common area, system loss) is spread in proportion to
+    # consumption, equally per sub-meter, or kept as its own "common" line. Returns
+    # (allocated kWh per sub-meter, amount per sub-meter, common kWh, common amount).
+    if mode not in ALLOCATION_MODES:
+        raise ValueError(f"unknown allocation mode {mode!r}")
+    if np is not None:
+        kwh = np.clip(np.asarray(sub_kwh, dtype=np.float64), 0, None)
+        n, measured = len(kwh), float(kwh.sum())
+        scaled = lambda values, factor, offset=0.0: values * factor + offset
+        ones = np.ones(n)
+    else:
+        kwh = [max(float(k), 0.0) for k in sub_kwh]
+        n, measured = len(kwh), sum(kwh)
+        scaled = lambda values, factor, offset=0.0: [v * factor + offset for v in values]
+        ones = [1.0] * n
+    remainder = main_kwh - measured
+    common = 0.0
+    if main_kwh <= 0 or not n:
+        basis = kwh
+    elif measured <= 0:
+        basis = scaled(ones, main_kwh / n)
+    elif remainder < 0 or mode == "proportional":
+        # also when the sub-meters read more than the main meter: scale them down to it
+        basis = scaled(kwh, main_kwh / measured)
+    elif mode == "equal":
+        basis = scaled(kwh, 1.0, remainder / n)
+    else:
+        basis, common = kwh, remainder
+    weights = list(basis) + [common]
+    amounts = centavo_split(main_total, weights)
+    return basis, amounts[:n], common, float(amounts[n]) if len(amounts) > n else 0.0
+
+
+def allocate_records(records, main_total, main_kwh, mode="proportional"):
+    # Rows of (Auth, metered kWh, allocated kWh, amount) for submeter.json records, plus
+    # a Common Area row when the remainder is billed on its own
+    kwh = [parse_reading(rec.get("Sub_Meter", {}).get("Total Actual Consumption (kWh)") or 0) for rec in records]
+    basis, amounts, common, common_amount = allocate_bill(main_total, main_kwh, kwh, mode)
+    rows = [(rec.get("Sub_Meter", {}).get("Auth", ""), k, float(b), float(a))
+            for rec, k, b, a in zip(records, kwh, basis, amounts)]
+    if common or common_amount:
+        rows.append(("Common Area", 0.0, common, common_amount))
+    return rows
+
+
+# --- Billing Folder Catalog ---
+BILLING_DIR = r"C:\Users\user\PycharmProjects\Utilities\Billing"
+CATALOG_MANIFEST = "billing_catalog.json"
+BILL_FIELDS = ("Consumer Name", "Account Number (CAN)", "Electric Meter Number", "Billing Period From",
+               "Previous kWh Reading", "Billing Period Up To", "Current kWh Reading",
+               "Total Actual Consumption (kWh)", "Rate This Month", "TOTAL Bill")
+
+
+def parse_bill_file(path):
+    # Same reading rules as load_data/load_specific_values, from one open of the file
+    rows = read_bill_rows(path)
+    left = bill_values(rows)
+    p, c, t = specific_values(rows)
+    left["Previous kWh Reading"] = p
+    left["Current kWh Reading"] = c
+    left["Total Actual Consumption (kWh)"] = t
+    return {f: left.get(f, "") for f in BILL_FIELDS}
+
+
+class BillCatalog:
+    # Manifest of every bill CSV in the Billing folder keyed by path, with the mtime/size it was
+    # parsed at, so a rescan only opens new or changed files.
+    def __init__(self, folder=BILLING_DIR, manifest_path=CATALOG_MANIFEST):
+        self.folder = folder
+        self.manifest_path = manifest_path
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.by_field = {}
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as mf:
+                    self.entries = json.load(mf).get("entries", {})
+            except ValueError:
+                self.entries = {}
+        self.reindex()
+
+    def reindex(self):
+        self.by_field = {f: {} for f in ("Consumer Name", "Account Number (CAN)", "Electric Meter Number")}
+        for path, entry in self.entries.items():
+            for field, index in self.by_field.items():
+                index.setdefault(entry["bill"].get(field, "").strip().casefold(), []).append(path)
+
+    def scan(self, workers=8):
+        found = {}
+        if os.path.isdir(self.folder):
+            with os.scandir(self.folder) as it:
+                for e in it:
+                    if e.is_file() and e.name.lower().endswith(".csv"):
+                        st = e.stat()
+                        found[e.path] = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            changed = [path for path, (mtime, size) in found.items()
+                       if (self.entries.get(path, {}).get("mtime"), self.entries.get(path, {}).get("size")) != (mtime, size)]
+            removed = [path for path in self.entries if path not in found]
+
+        def parse(path):
+            try:
+                return path, parse_bill_file(path)
+            except Exception as e:
+                print(f"Skipping {path}:", e)
+                return path, None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(parse, changed))
+        with self.lock:
+            for path in removed:
+                del self.entries[path]
+            for path, bill in parsed:
+                if bill is not None:
+                    mtime, size = found[path]
+                    self.entries[path] = {"mtime": mtime, "size": size, "bill": bill}
+            self.reindex()
+            if changed or removed:
+                self.save()
+        return len(changed), len(removed), len(self.entries)
+
+    def save(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as mf:
+            json.dump({"folder": self.folder, "entries": self.entries}, mf)
+        os.replace(tmp_path, self.manifest_path)
+
+    def query(self, consumer=None, account=None, meter=None, period=None):
+        # Returns (path, bill) pairs; period is any date inside the billing period
+        with self.lock:
+            paths = None
+            for field, value in (("Consumer Name", consumer), ("Account Number (CAN)", account),
+                                 ("Electric Meter Number", meter)):
+                if value:
+                    hits = set(self.by_field[field].get(value.strip().casefold(), []))
+                    paths = hits if paths is None else paths & hits
+            if paths is None:
+                paths = set(self.entries)
+            result = []
+            day = date_ordinal(period) if period else None
+            for path in sorted(paths):
+                bill = self.entries[path]["bill"]
+                if day is not None:
+                    lo = date_ordinal(bill.get("Billing Period From", ""))
+                    hi = date_ordinal(bill.get("Billing Period Up To", ""))
+                    if lo is None or hi is None or not lo <= day <= hi:
+                        continue
+                result.append((path, bill))
+            return result
+
+
+# --- Local JSON API ---
+API_HOST = "127.0.0.1"
+API_PORT = 8765
+API_MAX_HEADER = 64 * 1024
+API_MAX_BODY = 256 * 1024 * 1024
+API_RECORD_LIMIT = 1000
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                411: "Length Required", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+                500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def api_reading_problem(items, rows):
+    # Index of the first reading whose previous, current or rate is missing or not a number, or None
+    prev = reading_values([row[3] for row in rows])
+    curr = reading_values([row[5] for row in rows])
+    rates = reading_values([str(item.get("rate", 0)) for item in items])
+    for i, (p, c, r) in enumerate(zip(prev, curr, rates)):
+        if p != p or c != c or r != r:  # NaN
+            return i
+    return None
+
+
+def api_record_problem(rec):
+    # Why a POSTed record can't go into the store, or None: the journal, compaction and the
+    # typed columns all expect the string values the app itself saves
+    if not isinstance(rec, dict) or not isinstance(rec.get("Sub_Meter"), dict):
+        return "expected submeter.json records ({\"FileKey\": .., \"Sub_Meter\": {..}})"
+    if not isinstance(rec.get("FileKey"), str):
+        return "FileKey must be a string"
+    sub = rec["Sub_Meter"]
+    for field in RECORD_KEY_FIELDS[1:]:
+        if not isinstance(sub.get(field), str):
+            return f"Sub_Meter needs a string {field!r}"
+    for field, value in sub.items():
+        if not isinstance(value, str):
+            return f"Sub_Meter {field!r} must be a string, not {type(value).__name__}"
+    return None
+
+
+class SubmeterApi:
+    # HTTP/1.1 JSON service over asyncio streams: keep-alive and pipelined requests on one
+    # connection, array bodies for batches. Only request parsing runs on the event loop;
+    # index reads, billing and appends (fsync) run in the default thread pool.
+    def __init__(self, index, rate, archive=None):
+        self.index = index
+        self.rate = rate
+        self.archive = archive  # GET /records also answers from archived periods
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("POST", "/compute"): self.compute,
+            ("POST", "/bill"): self.bill,
+            ("GET", "/records"): self.find,
+            ("POST", "/records"): self.append,
+        }
+        self.encode = json.JSONEncoder(separators=(",", ":")).encode
+
+    async def health(self, query, body):
+        return {"status": "ok", "records": await self.blocking(self.count)}
+
+    def count(self):
+        self.index.refresh()
+        return self.index.count()
+
+    async def compute(self, query, body):
+        # {"previous": .., "current": .., "rate": optional} or a list of them -> consumption and amount
+        items = body if isinstance(body, list) else [body]
+        if not all(isinstance(item, dict) for item in items):
+            raise ApiError(400, "expected an object or a list of objects")
+        rows = [reading_row(item) for item in items]
+        bad = api_reading_problem(items, rows)
+        if bad is not None:
+            where = f"item {bad}: " if isinstance(body, list) else ""
+            raise ApiError(400, where + "previous and current (and rate, if given) must be numbers")
+        prev = readings_to_floats([row[3] for row in rows])
+        curr = readings_to_floats([row[5] for row in rows])
+        if any("rate" in item for item in items):
+            cons = [c - p for p, c in zip(prev, curr)]
+            amounts = [k * parse_reading(item["rate"]) if "rate" in item else
+                       compute_sub_bills([0.0], [k], self.rate)[1][0] for item, k in zip(items, cons)]
+        else:
+            cons, amounts = compute_sub_bills(prev, curr, self.rate)
+        results = [{"consumption": round(float(k), 2), "amount": round(float(a), 2)} for k, a in zip(cons, amounts)]
+        return results if isinstance(body, list) else results[0]
+
+    async def bill(self, query, body):
+        # {"rows": [readings], "rate": optional, "file_key": optional, "save": optional}
+        if not isinstance(body, dict) or not isinstance(body.get("rows"), list):
+            raise ApiError(400, "expected {\"rows\": [...]}")
+        if not all(isinstance(item, dict) for item in body["rows"]):
+            raise ApiError(400, "rows must be objects")
+        if not isinstance(body.get("file_key", ""), str):
+            raise ApiError(400, "file_key must be a string")
+        rows = [normalized_row(reading_row(item)) for item in body["rows"]]
+        bad = api_reading_problem([{}] * len(rows), rows)
+        if bad is not None:
+            raise ApiError(400, f"row {bad}: previous and current must be numbers")
+        rate = float(reading_values([str(body["rate"])])[0]) if "rate" in body else self.rate
+        if rate != rate:
+            raise ApiError(400, "rate must be a number")
+        records = await self.blocking(lambda: list(bill_readings(rows, rate, body.get("file_key", ""))))
+        if body.get("save"):
+            for i, rec in enumerate(records):
+                problem = record_problem(rec)
+                if problem:
+                    raise ApiError(400, f"row {i} not saved: {problem}")  # nothing is saved
+            await self.blocking(self.index.append_many, records)
+        return records
+
+    async def find(self, query, body):
+        # /records?FileKey=..&Auth=..&Billing Period From=..&Billing Period Up To=..&offset=0&limit=1000
+        filters = {f: query[f] for f in RECORD_KEY_FIELDS if f in query}
+        try:
+            offset = int(query.get("offset", 0))
+            limit = min(int(query.get("limit", API_RECORD_LIMIT)), API_RECORD_LIMIT)
+        except ValueError:
+            raise ApiError(400, "offset and limit must be integers")
+        if offset < 0 or limit < 0:
+            raise ApiError(400, "offset and limit must not be negative")
+        return await self.blocking(self.find_page, filters, offset, limit)
+
+    def find_page(self, filters, offset, limit):
+        # In the thread pool: a refresh may reload the store, and the loop keeps serving meanwhile
+        if len(filters) == len(RECORD_KEY_FIELDS):
+            self.index.refresh()
+            key = [filters[f] for f in RECORD_KEY_FIELDS]
+            rec = self.index.lookup(*key)
+            if rec is None and self.archive is not None:
+                rec = self.archive.lookup(*key)
+            return [rec] if rec and offset == 0 and limit else []
+        return find_records(self.index, self.archive, filters, offset, limit)
+
+    async def append(self, query, body):
+        records = body if isinstance(body, list) else [body]
+        for i, rec in enumerate(records):
+            problem = api_record_problem(rec)
+            if problem:
+                raise ApiError(400, f"record {i}: {problem}" if isinstance(body, list) else problem)
+        await self.blocking(self.index.append_many, records)
+        return {"appended": len(records)}
+
+    async def blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            known = any(path == url.path for _, path in self.routes)
+            raise ApiError(405 if known else 404, f"{method} {url.path} is not supported")
+        try:
+            data = json.loads(body) if body else None
+        except ValueError as e:
+            raise ApiError(400, f"invalid JSON: {e}")
+        return await handler(dict(parse_qsl(url.query)), data)
+
+    async def handle(self, reader, writer):
+        profiler.count("api.connection")
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break  # client closed the connection
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 431, {"error": "headers too large"}, False)
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "bad request line"}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self.respond(writer, 411, {"error": "send a Content-Length"}, False)
+                    break
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= API_MAX_BODY:
+                    await self.respond(writer, 413 if length > 0 else 400, {"error": "bad Content-Length"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                started = time.perf_counter()
+                try:
+                    status, payload = 200, await self.dispatch(method, target, body)
+                except ApiError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                profiler.record("api." + urlsplit(target).path.strip("/"), time.perf_counter() - started)
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        data = self.encode(payload).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+        await writer.drain()
+
+    async def serve(self, host=API_HOST, port=API_PORT, ready=None):
+        server = await asyncio.start_server(self.handle, host, port, limit=API_MAX_HEADER)
+        if ready:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+
+def run_api_server(args):
+    try:
+        rate = billing_rate(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    api = SubmeterApi(submeter_index, rate, submeter_archive)
+    ready = lambda server: print(f"Serving the sub-meter API on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        asyncio.run(api.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# --- Background I/O ---
+IO_POLL_MS = 30
+
+
+class IOTask:
+    def __init__(self, label):
+        self.label = label
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class IOExecutor:
+    # Disk work runs on a small thread pool; results come back through a queue that the
+    # Tk main loop drains with root.after, so callbacks always touch widgets on the UI thread.
+    def __init__(self, root, status_var=None, workers=2):
+        self.root = root
+        self.status_var = status_var
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="meralco-io")
+        self.results = queue.Queue()
+        self.pending = []
+        self.polling = False
+
+    def submit(self, label, fn, *args, on_done=None, on_error=None):
+        task = IOTask(label)
+        self.pending.append(task)
+        self.update_busy()
+
+        def run():
+            if task.cancelled:
+                self.results.put((task, None, None, None))
+                return
+            try:
+                self.results.put((task, on_done, fn(*args), None))
+            except Exception as e:
+                self.results.put((task, on_error, None, e))
+
+        self.pool.submit(run)
+        if not self.polling:
+            self.polling = True
+            self.root.after(IO_POLL_MS, self.poll)
+        return task
+
+    def poll(self):
+        while True:
+            try:
+                task, callback, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if task in self.pending:
+                self.pending.remove(task)
+            self.update_busy()
+            if task.cancelled or callback is None:
+                if error is not None and not task.cancelled:
+                    print(f"{task.label} failed:", error)
+                continue
+            callback(error if error is not None else result)
+        if self.pending:
+            self.root.after(IO_POLL_MS, self.poll)
+        else:
+            self.polling = False
+
+    def cancel_all(self, event=None):
+        for task in self.pending:
+            task.cancel()
+        self.update_busy()
+
+    def update_busy(self):
+        active = [t for t in self.pending if not t.cancelled]
+        self.root.config(cursor="watch" if active else "")
+        if self.status_var is not None:
+            self.status_var.set(f"{active[0].label}... (Esc to cancel)" if active else "Ready")
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.shutdown(wait=False)
+
+
+def run_io(label, fn, *args, on_done=None, on_error=None):
+    # Falls back to running inline when there is no Tk main loop (e.g. headless use)
+    if io_executor is not None:
+        return io_executor.submit(label, fn, *args, on_done=on_done, on_error=on_error)
+    try:
+        result = fn(*args)
+    except Exception as e:
+        if on_error:
+            on_error(e)
+        return None
+    if on_done:
+        on_done(result)
+    return None
+
+
+@profiler.timed("load_file.io")
+def read_bill_details(fn):
+    with open(fn, newline="", encoding="utf-8") as cf:
+        return {row[0].strip(): row[1].strip() for row in csv.reader(cf) if len(row) >= 2}
+
+
+@profiler.timed("save_csv.io")
+def write_bill_csv(full_path, rows):
+    save_dir = os.path.dirname(full_path)
+    if not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+    tmp_path = full_path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as cf:
+        csv.writer(cf).writerows(rows)
+    os.replace(tmp_path, full_path)  # never leave a half-written bill behind
+    return full_path
+
+
+@profiler.timed("populate_filters.io")
+def read_filter_values():
+    # The working set plus the values listed in the archive footers
+    submeter_index.refresh()
+    return [sorted(set(submeter_index.values(field)) | submeter_archive.values(field)) for field in RECORD_KEY_FIELDS]
+
+
+@profiler.timed("load_json.io")
+def find_record(file_key, auth, bpf, bpu):
+    submeter_index.refresh()
+    rec = submeter_index.lookup(file_key, auth, bpf, bpu)
+    return rec if rec is not None else submeter_archive.lookup(file_key, auth, bpf, bpu)
+
+
+def find_records(index, archive, filters, offset=0, limit=None):
+    # index.find() and then the archived periods not saved again since, as one list to page
+    # through; archive may be None. Only the offset..offset+limit window is built.
+    index.refresh()
+    records = index.find(filters, offset, limit)
+    if archive is None or (limit is not None and len(records) >= limit):
+        return records
+    skip = 0 if records else max(0, offset - index.count(filters))
+    seen = set()
+
+    def unsaved():
+        for rec in archive.iter_records(filters):
+            key = record_key(rec)
+            if key in seen or any(record_field(rec, f) != v for f, v in filters.items()):
+                continue
+            seen.add(key)
+            if index.lookup(*key) is None:
+                yield rec
+
+    records.extend(islice(unsaved(), skip, None if limit is None else skip + limit - len(records)))
+    return records
+
+
+# --- Statement Rendering ---
+STATEMENT_FONTS = ("Courier New.ttf", "arial.ttf")
+SUB_STATEMENT_FIELDS = ("Billing Period From", "Previous kWh Reading", "Billing Period Up To",
+                        "Current kWh Reading", "Total Actual Consumption (kWh)", "Total Amount")
+_statement_renderer = None
+
+
+def statement_lines(top_items, sub_items):
+    lines = ["=== Top Details ==="]
+    max_key_len_top = max(len(k) for k in top_items.keys())
+    lines.extend(f"{key:<{max_key_len_top}} : {value}" for key, value in top_items.items())
+    lines.append("")
+    lines.append("=== Sub-Metering Details ===")
+    max_key_len_sub = max(len(k) for k in sub_items.keys())
+    lines.extend(f"{key:<{max_key_len_sub}} : {value}" for key, value in sub_items.items())
+    return lines
+
+
+def record_statement_items(rec, bill=None):
+    # Top details come from the loaded bill when it is the record's main bill, else from the FileKey
+    sub_data = rec.get("Sub_Meter", {})
+    file_key = rec.get("FileKey", "")
+    if bill and file_key == "_".join(bill.get(f, "") for f in ("Consumer Name", "Billing Period From",
+                                                                 "Billing Period Up To")):
+        top_items = dict(bill)
+    else:
+        parts = file_key.rsplit("_", 2)
+        parts = [""] * (3 - len(parts)) + parts
+        top_items = {"Consumer Name": parts[0], "Billing Period From": parts[1], "Billing Period Up To": parts[2]}
+    top_items["Authorized"] = sub_data.get("Auth", "")
+    sub_items = {key: sub_data.get(key, "") for key in SUB_STATEMENT_FIELDS}
+    return top_items, sub_items
+
+
+class StatementRenderer:
+    # Fonts are loaded once and line sizes cached, so a statement is measured and drawn in one pass
+    font_size = 20
+    line_spacing = 10
+    padding = 20
+    background_color = "#FFFFFF"
+    text_color = "#000000"
+    max_cached_lines = 4096
+
+    def __init__(self):
+        from PIL import Image, ImageDraw, ImageFont
+        self.Image = Image
+        self.ImageDraw = ImageDraw
+        self.font = None
+        for name in STATEMENT_FONTS:
+            try:
+                self.font = ImageFont.truetype(name, self.font_size)
+                break
+            except IOError:
+                pass
+        if self.font is None:
+            self.font = ImageFont.load_default()
+        self.metrics = {}
+
+    def measure(self, line):
+        size = self.metrics.get(line)
+        if size is None:
+            if len(self.metrics) >= self.max_cached_lines:
+                self.metrics.clear()
+            bbox = self.font.getbbox(line)
+            size = self.metrics[line] = (bbox[2] - bbox[0], bbox[3] - bbox[1])
+        return size
+
+    @profiler.timed("statement.render")
+    def render(self, lines):
+        line_sizes = [self.measure(line) for line in lines]
+        max_line_width = max(w for w, _ in line_sizes)
+        total_height = sum(h for _, h in line_sizes) + self.line_spacing * (len(lines) - 1)
+        img = self.Image.new("RGB", (max_line_width + 2 * self.padding, total_height + 2 * self.padding),
+                             color=self.background_color)
+        draw = self.ImageDraw.Draw(img)
+        y = self.padding
+        for line, (w, h) in zip(lines, line_sizes):
+            # Section headings (=== ... ===) are centered
+            if line.startswith("===") and line.endswith("==="):
+                x = self.padding + (max_line_width - w) // 2
+            else:
+                x = self.padding
+            draw.text((x, y), line, fill=self.text_color, font=self.font)
+            y += h + self.line_spacing
+        return img
+
+
+def get_statement_renderer():
+    global _statement_renderer
+    if _statement_renderer is None:
+        _statement_renderer = StatementRenderer()
+    return _statement_renderer
+
+
+def statement_filename(rec):
+    key = record_key(rec)
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", "_".join(k for k in key if k)) + ".png"
+
+
+def render_statement_files(jobs):
+    # Process-pool worker: jobs is a list of (lines, path); each process keeps its own renderer
+    renderer = get_statement_renderer()
+    for lines, path in jobs:
+        renderer.render(lines).save(path, "PNG")
+    return len(jobs)
+
+
+def export_statement_images(records, out_dir, bill=None, workers=None, chunk_size=64):
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = []
+    for rec in records:
+        top_items, sub_items = record_statement_items(rec, bill)
+        jobs.append((statement_lines(top_items, sub_items), os.path.join(out_dir, statement_filename(rec))))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    if len(chunks) <= 1:
+        return sum(render_statement_files(chunk) for chunk in chunks)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(render_statement_files, chunks))
+
+
+# --- Reactive Calculation Model ---
+class CalcCell:
+    # Input cells parse a StringVar once per batch of edits; derived cells recompute from their
+    # inputs only when one of them changed, and push the result to their output callback.
+    def __init__(self, inputs=(), fn=None, var=None, parse=None, output=None):
+        self.inputs = inputs
+        self.fn = fn
+        self.var = var
+        self.parse = parse
+        self.output = output
+        self.value = None
+
+    def update(self):
+        if self.var is not None:
+            value = self.parse(self.var.get())
+        else:
+            value = self.fn(*[cell.value for cell in self.inputs])
+        changed = value != self.value
+        self.value = value
+        if self.output is not None:
+            self.output(value)
+        return changed
+
+
+class CalcGraph:
+    def __init__(self, root):
+        self.root = root
+        self.cells = []  # creation order is dependency order
+        self.named = {}
+        self.dirty = set()
+        self.scheduled = False
+
+    def add(self, cell, name=None):
+        cell.update()
+        self.cells.append(cell)
+        if name:
+            self.named[name] = cell
+        if cell.var is not None:
+            cell.var.trace_add("write", lambda *args: self.invalidate(cell))
+        return cell
+
+    def number(self, var, name=None, output=None):
+        return self.add(CalcCell(var=var, parse=parse_reading, output=output), name)
+
+    def watch(self, var, output):
+        return self.add(CalcCell(var=var, parse=str, output=output))
+
+    def derive(self, fn, *inputs, output=None, name=None):
+        return self.add(CalcCell(inputs=inputs, fn=fn, output=output), name)
+
+    def invalidate(self, cell):
+        profiler.count("calc.trace_write")
+        self.dirty.add(cell)
+        if not self.scheduled:
+            self.scheduled = True
+            self.root.after_idle(self.flush)
+
+    @profiler.timed("calc.flush")
+    def flush(self):
+        # Every cell is recomputed at most once per batch, however many writes happened
+        self.scheduled = False
+        dirty, self.dirty = self.dirty, set()
+        if not dirty:
+            return
+        changed = set()
+        for cell in self.cells:
+            if cell in dirty or any(i in changed for i in cell.inputs):
+                if cell.update():
+                    changed.add(cell)
+
+
+def get_calc_graph(widget):
+    global calc_graph
+    if calc_graph is None:
+        calc_graph = CalcGraph(widget.winfo_toplevel())
+    return calc_graph
+
+
+def consumption_text(cons):
+    return f"{cons:.2f}" if cons != 0 else ""
+
 
-    def enter(self, event=None):
-        x = self.widget.winfo_rootx() + 20
-        y = self.widget.winfo_rooty() + 20
-        self.top = tk.Toplevel(self.widget)
-        self.top.overrideredirect(True)
-        self.top.geometry(f"+{x}+{y}")
-        tk.Label(self.top,
-                 text=self.text,
-                 justify='left',
-                 background="#ffffe0",
-                 relief='solid',
-                 borderwidth=1,
-                 font=("tahoma", "8", "normal")
-                 ).pack(ipadx=1)
+# --- Record Browser ---
+BROWSER_CACHE_ROWS = 500
 
-    def leave(self, event=None):
-        if self.top:
-            self.top.destroy()
 
+class RecordBrowser:
+    # A fixed set of Treeview rows is reused as a window over the index; only the visible
+    # records are ever turned into items, and pages are fetched from storage on demand.
+    def __init__(self, parent, on_open, visible_rows=10):
+        self.on_open = on_open
+        self.visible_rows = visible_rows
+        self.frame = ttk.Frame(parent)
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(0, weight=1)
+        names = [name for name, _, _ in BROWSER_COLUMNS]
+        self.tree = ttk.Treeview(self.frame, columns=names, show="headings", height=visible_rows,
+                                 selectmode="browse")
+        for name, _, width in BROWSER_COLUMNS:
+            self.tree.heading(name, text=name, command=lambda c=name: self.sort_by(c))
+            self.tree.column(name, width=width, stretch=(name == "FileKey"))
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_scroll)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.items = [self.tree.insert("", "end", values=()) for _ in range(visible_rows)]
+        self.tree.bind("<Double-1>", self.on_double_click)
+        self.tree.bind("<Return>", self.on_double_click)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_to(self.offset - (1 if e.delta > 0 else -1) * 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll_to(self.offset - 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_to(self.offset + 3))
+        self.tree.bind("<Up>", lambda e: self.step(-1))
+        self.tree.bind("<Down>", lambda e: self.step(1))
+        self.tree.bind("<Prior>", lambda e: self.step(-visible_rows))
+        self.tree.bind("<Next>", lambda e: self.step(visible_rows))
+        self.sort_column = None
+        self.descending = False
+        self.total = 0
+        self.offset = 0
+        self.cache_start = 0
+        self.cache = []
+        self.shown = []
+        self.generation = 0  # bumped by refresh/sort; pages fetched for an older one are dropped
+        self.fetching = None  # cache_start of the page being fetched
 
-def convert_date_strvar(event, var):
-    val = var.get().strip()
-    if not val:
-        return
-    norm = val.replace("-", "/").replace(".", "/").replace(" ", "/")
-    try:
-        parsed = dt.strptime(norm, "%d/%m/%Y")
-    except ValueError:
-        try:
-            parsed = dt.strptime(norm, "%d/%m/%y")
-        except ValueError:
-            return
-    var.set(parsed.strftime("%d-%b-%Y"))
+    def refresh(self):
+        column, descending = self.sort_column, self.descending
+        self.generation += 1
+        self.fetching = None
+        generation = self.generation
 
+        def fetch():
+            submeter_index.refresh()
+            start = max(0, self.offset - BROWSER_CACHE_ROWS // 2)
+            return submeter_index.count(), start, submeter_index.page(column, descending, start, BROWSER_CACHE_ROWS)
 
-def format_combo_date(var):
-    value = var.get().strip()
-    if value:
-        norm = value.replace("-", "/").replace(".", "/").replace(" ", "/")
-        try:
-            parsed = dt.strptime(norm, "%d/%m/%Y")
-        except ValueError:
-            try:
-                parsed = dt.strptime(norm, "%d/%m/%y")
-            except ValueError:
+        def apply(result):
+            if generation != self.generation:
                 return
-        var.set(parsed.strftime("%d-%b-%Y"))
+            self.total, self.cache_start, self.cache = result
+            self.scroll_to(self.offset)
 
+        run_io("Reading records", fetch, on_done=apply)
 
-def load_data(fn):
-    left = {}
-    with open(fn, newline="", encoding="utf-8") as f:
-        for row in csv.reader(f):
-            if not any(cell.strip() for cell in row):
-                continue
-            left[row[0]] = row[1]
-    return left, [], []
+    def fetch_page(self, start):
+        # Pages come from storage on the I/O pool; the window is redrawn when one arrives
+        if self.fetching == start:
+            return
+        self.fetching = start
+        generation = self.generation
 
+        def apply(page):
+            if generation != self.generation:
+                return
+            self.fetching = None
+            self.cache_start, self.cache = start, page
+            self.scroll_to(self.offset)
 
-def load_specific_values(fn):
-    with open(fn, newline="", encoding="utf-8") as f:
-        rows = list(csv.reader(f))
-    try:
-        prev = rows[4][1]
-    except:
-        prev = "0"
-    try:
-        curr = rows[6][1]
-    except:
-        curr = "0"
-    try:
-        tot = rows[7][1]
-    except:
-        try:
-            tot = str(float(curr.replace(",", "")) - float(prev.replace(",", "")))
-        except:
-            tot = "0"
-    return prev, curr, tot
+        run_io("Reading records", submeter_index.page, self.sort_column, self.descending, start,
+               BROWSER_CACHE_ROWS, on_done=apply)
+
+    def sort_by(self, column):
+        if self.sort_column == column:
+            self.descending = not self.descending
+        else:
+            self.sort_column, self.descending = column, False
+        for name, _, _ in BROWSER_COLUMNS:
+            arrow = (" \u25bc" if self.descending else " \u25b2") if name == column else ""
+            self.tree.heading(name, text=name + arrow)
+        self.offset = 0
+        self.cache = []
+        self.refresh()
+
+    def rows(self, start, count):
+        # Blank until a window outside the cached page has been fetched
+        end = min(start + count, self.total)
+
+        def cached():
+            return self.cache_start <= start and end <= self.cache_start + len(self.cache)
+
+        if not cached():
+            self.fetch_page(max(0, start - BROWSER_CACHE_ROWS // 2))
+            if not cached():
+                return []
+        return self.cache[start - self.cache_start:end - self.cache_start]
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, self.total - self.visible_rows))
+        self.shown = self.rows(self.offset, self.visible_rows) if self.total else []
+        for i, iid in enumerate(self.items):
+            if i < len(self.shown):
+                self.tree.item(iid, values=[record_field(self.shown[i], n) for n, _, _ in BROWSER_COLUMNS])
+            else:
+                self.tree.item(iid, values=())
+        if self.total > self.visible_rows:
+            self.scrollbar.set(self.offset / self.total, (self.offset + self.visible_rows) / self.total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        elif unit == "pages":
+            self.scroll_to(self.offset + int(amount) * self.visible_rows)
+        else:
+            self.scroll_to(self.offset + int(amount))
+
+    def step(self, delta):
+        # Moves the selection, scrolling the window when it reaches an edge
+        selected = self.tree.selection()
+        pos = self.items.index(selected[0]) if selected else 0
+        target = pos + delta
+        if target < 0 or target >= self.visible_rows:
+            self.scroll_to(self.offset + delta)
+            target = max(0, min(target, min(self.visible_rows, len(self.shown)) - 1))
+        if self.shown:
+            self.tree.selection_set(self.items[min(target, len(self.shown) - 1)])
+            self.tree.focus(self.items[min(target, len(self.shown) - 1)])
+        return "break"
+
+    def on_double_click(self, event=None):
+        selected = self.tree.selection()
+        if selected:
+            pos = self.items.index(selected[0])
+            if pos < len(self.shown):
+                self.on_open(self.shown[pos])
 
 
 # --- Bill Details Tab ---
-def setup_gui(container):
+BILL_FORM_FIELDS = (
+    "Consumer Name",
+    "Account Number (CAN)",
+    "Electric Meter Number",
+    "Billing Period From",
+    "Previous kWh Reading",
+    "Billing Period Up To",
+    "Current kWh Reading",
+    "Total Actual Consumption (kWh)",
+    "Rate This Month",
+    "TOTAL Bill"
+)
+BILL_DATE_FIELDS = ("Billing Period From", "Billing Period Up To")
+
+
+@profiler.timed("save_csv")
+def save_bill_form(values):
+    # values maps each BILL_FORM_FIELDS label to its text; saved as Billing/<Consumer>_<From>_<UpTo>.csv
+    for f in BILL_FORM_FIELDS:
+        if not values[f].strip():
+            messagebox.showerror("Save CSV", f"Field '{f}' cannot be empty.")
+            return
+    rows = [[f, values[f]] for f in BILL_FORM_FIELDS]
+    consumer = values["Consumer Name"] or "BillDetails"
+    fn = f"{consumer}_{values['Billing Period From']}_{values['Billing Period Up To']}.csv".replace(" ", "_")
+    full_path = os.path.join(BILLING_DIR, fn)
+    run_io("Saving " + fn, write_bill_csv, full_path, rows,
+           on_done=lambda path: messagebox.showinfo("Save CSV", f"Saved as:\n{path}"),
+           on_error=lambda e: messagebox.showerror("Save CSV", f"Failed to save:\n{e}"))
+
+
+def setup_gui(container, left=None):
     global global_bill_rate
-    left, _, _ = load_data("bill_detail.csv")
-    p, c, t = load_specific_values("bill_detail.csv")
-    left["Previous kWh Reading"] = p
-    left["Current kWh Reading"] = c
-    left["Total Actual Consumption (kWh)"] = ""
-    fields = [
-        ("Consumer Name", 0),
-        ("Account Number (CAN)", 1),
-        ("Electric Meter Number", 2),
-        ("Billing Period From", 3),
-        ("Previous kWh Reading", 4),
-        ("Billing Period Up To", 5),
-        ("Current kWh Reading", 6),
-        ("Total Actual Consumption (kWh)", 7),
-        ("Rate This Month", 8),
-        ("TOTAL Bill", 9)
-    ]
-    date_fields = ["Billing Period From", "Billing Period Up To"]
+    if left is None:
+        left = load_bill_model()
+    fields = [(f, r) for r, f in enumerate(BILL_FORM_FIELDS)]
+    date_fields = BILL_DATE_FIELDS
     form_frame = ttk.Frame(container, padding=10)
     form_frame.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
     container.columnconfigure(0, weight=1)
@@ -145,16 +3546,14 @@ def setup_gui(container):
     field_vars = {}
     for f, _ in fields:
         field_vars[f] = tk.StringVar(value=left.get(f, ""))
+    graph = get_calc_graph(container)
     for f, r in fields:
         ttk.Label(form_frame, text=f).grid(row=r, column=0, sticky="w", padx=2, pady=2)
         state = "readonly" if f == "Total Actual Consumption (kWh)" else "normal"
         ent = ttk.Entry(form_frame, textvariable=field_vars[f], state=state)
         if f in date_fields:
             ent.bind("<FocusOut>", lambda e, var=field_vars[f]: convert_date_strvar(e, var))
-        w = max(20, len(field_vars[f].get()) + 2)
-        ent.config(width=w)
-        field_vars[f].trace_add("write",
-                                lambda *args, e=ent, var=field_vars[f]: e.config(width=max(20, len(var.get()) + 2)))
+        graph.watch(field_vars[f], lambda value, e=ent: e.config(width=max(20, len(value) + 2)))
         ent.grid(row=r, column=1, sticky="ew", padx=2, pady=2)
         if f in date_fields:
             hlp = ttk.Label(form_frame, text="?", foreground="blue", cursor="question_arrow")
@@ -163,86 +3562,59 @@ def setup_gui(container):
         if state != "readonly":
             ent.bind("<Return>", on_enter)
 
-    def update_consumption(*args):
+    def set_bill_rate(rate):
         global global_bill_rate
-        try:
-            prev_val = float(field_vars["Previous kWh Reading"].get().replace(",", ""))
-        except:
-            prev_val = 0
-        try:
-            curr_val = float(field_vars["Current kWh Reading"].get().replace(",", ""))
-        except:
-            curr_val = 0
-        consumption = curr_val - prev_val
-        field_vars["Total Actual Consumption (kWh)"].set(f"{consumption:.2f}" if consumption != 0 else "")
-        try:
-            global_bill_rate = float(field_vars["Rate This Month"].get().replace(",", ""))
-        except:
-            global_bill_rate = 0
+        global_bill_rate = rate
 
-    field_vars["Previous kWh Reading"].trace_add("write", update_consumption)
-    field_vars["Current kWh Reading"].trace_add("write", update_consumption)
-    update_consumption()
+    prev_cell = graph.number(field_vars["Previous kWh Reading"])
+    curr_cell = graph.number(field_vars["Current kWh Reading"])
+    graph.derive(lambda p, c: c - p, prev_cell, curr_cell, name="bill_consumption",
+                 output=lambda cons: field_vars["Total Actual Consumption (kWh)"].set(consumption_text(cons)))
+    graph.number(field_vars["Rate This Month"], name="bill_rate", output=set_bill_rate)
     footer = ttk.Frame(container)
     footer.grid(row=1, column=0, sticky="w", padx=5, pady=5)
 
+    @profiler.timed("load_file")
     def load_file():
         fn = filedialog.askopenfilename(title="Select CSV File", filetypes=[("CSV Files", "*.csv")])
         if fn:
-            try:
-                with open(fn, newline="", encoding="utf-8") as cf:
-                    details = {row[0].strip(): row[1].strip() for row in csv.reader(cf) if len(row) >= 2}
-                for f, var in field_vars.items():
-                    if f in details:
-                        var.set(details[f])
-                update_consumption()
-                global sub_detail_vars_global, sub_update_top_consumption
-                if sub_detail_vars_global:
-                    for key in sub_detail_vars_global:
-                        if key in details:
-                            sub_detail_vars_global[key].set(details[key])
-                    if sub_update_top_consumption:
-                        sub_update_top_consumption()
-                messagebox.showinfo("Load File", "File loaded successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load file:\n{e}")
+            run_io("Loading " + os.path.basename(fn), read_bill_details, fn,
+                   on_done=apply_loaded_file,
+                   on_error=lambda e: messagebox.showerror("Error", f"Failed to load file:\n{e}"))
 
-    def save_csv():
-        for f, _ in fields:
-            if not field_vars[f].get().strip():
-                messagebox.showerror("Save CSV", f"Field '{f}' cannot be empty.")
-                return
-        rows = [[f, field_vars[f].get()] for f, _ in fields]
-        consumer = rows[0][1] if rows[0][1] else "BillDetails"
-        period_from = rows[3][1] if len(rows) > 3 else "From"
-        period_to = rows[5][1] if len(rows) > 5 else "To"
-        fn = f"{consumer}_{period_from}_{period_to}.csv".replace(" ", "_")
-        save_dir = r"C:\Users\user\PycharmProjects\Utilities\Billing"
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
-        full_path = os.path.join(save_dir, fn)
+    @profiler.timed("apply_loaded_file")
+    def apply_loaded_file(details):
         try:
-            with open(full_path, "w", newline="", encoding="utf-8") as cf:
-                csv.writer(cf).writerows(rows)
-            messagebox.showinfo("Save CSV", f"Saved as:\n{full_path}")
+            for f, var in field_vars.items():
+                if f in details:
+                    var.set(details[f])
+                    left[f] = details[f]  # a Sub-Metering tab built later starts from these
+            global sub_detail_vars_global
+            if sub_detail_vars_global:
+                for key in sub_detail_vars_global:
+                    if key in details:
+                        sub_detail_vars_global[key].set(details[key])
+            graph.flush()
+            messagebox.showinfo("Load File", "File loaded successfully!")
         except Exception as e:
-            messagebox.showerror("Save CSV", f"Failed to save:\n{e}")
+            messagebox.showerror("Error", f"Failed to load file:\n{e}")
+
+    def save_csv():
+        save_bill_form({f: var.get() for f, var in field_vars.items()})
 
     ttk.Button(footer, text="Load File", command=load_file).pack(side="left", padx=5)
     ttk.Button(footer, text="Save as CSV", command=save_csv).pack(side="left", padx=5)
+    ttk.Button(footer, text="Open Accounts...", command=open_accounts).pack(side="left", padx=5)
 
 
 # --- Sub-Metering Tab ---
-def setup_sub_metering(container):
-    global sub_detail_vars_global, sub_bottom_vars, sub_update_top_consumption, sub_update_sub, global_bill_rate
+def setup_sub_metering(container, left=None):
+    global sub_detail_vars_global, sub_bottom_vars
     container.columnconfigure(0, weight=1)
     details_frame = ttk.Frame(container, padding=5, relief="ridge")
     details_frame.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
-    left, _, _ = load_data("bill_detail.csv")
-    p, c, t = load_specific_values("bill_detail.csv")
-    left["Previous kWh Reading"] = p
-    left["Current kWh Reading"] = c
-    left["Total Actual Consumption (kWh)"] = ""
+    if left is None:
+        left = load_bill_model()
     fields_top = [
         ("Consumer Name", 0),
         ("Account Number (CAN)", 1),
@@ -268,21 +3640,11 @@ def setup_sub_metering(container):
         if state != "readonly":
             ent.bind("<Return>", on_enter)
 
-    def update_top_consumption(*args):
-        try:
-            prev_val = float(detail_vars["Previous kWh Reading"].get().replace(",", ""))
-        except:
-            prev_val = 0
-        try:
-            curr_val = float(detail_vars["Current kWh Reading"].get().replace(",", ""))
-        except:
-            curr_val = 0
-        cons = curr_val - prev_val
-        detail_vars["Total Actual Consumption (kWh)"].set(f"{cons:.2f}" if cons != 0 else "")
-
-    detail_vars["Previous kWh Reading"].trace_add("write", update_top_consumption)
-    detail_vars["Current kWh Reading"].trace_add("write", update_top_consumption)
-    update_top_consumption()
+    graph = get_calc_graph(container)
+    graph.derive(lambda p, c: c - p,
+                 graph.number(detail_vars["Previous kWh Reading"]),
+                 graph.number(detail_vars["Current kWh Reading"]),
+                 output=lambda cons: detail_vars["Total Actual Consumption (kWh)"].set(consumption_text(cons)))
     sub_detail_vars_global = detail_vars
 
     # Authorized entry
@@ -316,26 +3678,16 @@ def setup_sub_metering(container):
     ttk.Label(sub_frame, textvariable=total_amount, width=30, relief="sunken").grid(row=5, column=1, sticky="w", padx=2,
                                                                                     pady=2)
 
-    def update_sub(*args):
-        try:
-            prev_val = float(sub_vars["Previous kWh Reading"].get().replace(",", ""))
-        except:
-            prev_val = 0
-        try:
-            curr_val = float(sub_vars["Current kWh Reading"].get().replace(",", ""))
-        except:
-            curr_val = 0
-        cons = curr_val - prev_val
-        total_consumption.set(f"{cons:.2f}")
-        global global_bill_rate
-        total_amount.set(f"{cons * global_bill_rate:.2f}")
-
-    sub_vars["Previous kWh Reading"].trace_add("write", update_sub)
-    sub_vars["Current kWh Reading"].trace_add("write", update_sub)
-    update_sub()
+    # The amount follows both the readings here and Rate This Month on the Bill Detail tab. This tab
+    # bills the flat rate; the compiled rate-component plan is only used by --components (CLI and API).
+    rate_cell = graph.named.get("bill_rate") or graph.derive(lambda: global_bill_rate)
+    sub_cons = graph.derive(lambda p, c: c - p,
+                            graph.number(sub_vars["Previous kWh Reading"]),
+                            graph.number(sub_vars["Current kWh Reading"]),
+                            output=lambda cons: total_consumption.set(f"{cons:.2f}"))
+    graph.derive(lambda cons, rate: cons * rate, sub_cons, rate_cell,
+                 output=lambda amount: total_amount.set(f"{amount:.2f}"))
     sub_bottom_vars = sub_vars
-    sub_update_top_consumption = update_top_consumption
-    sub_update_sub = update_sub
 
     # Filtering frame and comboboxes for JSON records
     footer_sub = ttk.Frame(container, padding=5)
@@ -348,6 +3700,10 @@ def setup_sub_metering(container):
     auth_var = tk.StringVar()
     bpf_var = tk.StringVar()
     bpu_var = tk.StringVar()
+    filter_vars = {"FileKey": filekey_var, "Auth": auth_var, "From": bpf_var, "Up To": bpu_var}
+    filter_edited = set()  # fields the operator set since populate_filters filled them in; only these filter Export
+    for field, var in filter_vars.items():
+        var.trace_add("write", lambda *_, field=field: filter_edited.add(field))
 
     ttk.Label(filter_frame, text="FileKey:").grid(row=0, column=0, padx=2, pady=2, sticky="w")
     filekey_combo = ttk.Combobox(filter_frame, textvariable=filekey_var, values=[], state="normal", width=60)
@@ -371,52 +3727,34 @@ def setup_sub_metering(container):
     bpu_combo = ttk.Combobox(filter_frame, textvariable=bpu_var, values=[], state="normal", width=12)
     bpu_combo.grid(row=1, column=5, padx=2, pady=2, sticky="w")
 
+    # Type-ahead: narrow the FileKey/Auth lists to prefix and substring matches while typing
+    def bind_type_ahead(combo, field):
+        pending = []
+
+        def update():
+            pending.clear()
+            combo['values'] = submeter_index.suggest(field, combo.get())
+
+        def on_key(event):
+            if event.keysym in ("Up", "Down", "Return", "Tab", "Escape", "ISO_Left_Tab"):
+                return
+            if not pending:
+                pending.append(combo.after_idle(update))
+
+        combo.bind("<KeyRelease>", on_key, add="+")
+
+    bind_type_ahead(filekey_combo, "FileKey")
+    bind_type_ahead(auth_combo, "Auth")
+
     bpf_combo.bind("<Return>", lambda e: (format_combo_date(bpf_var), e.widget.tk_focusNext().focus_set(), "break"))
     bpf_combo.bind("<FocusOut>", lambda e: format_combo_date(bpf_var))
     bpu_combo.bind("<Return>", lambda e: (format_combo_date(bpu_var), e.widget.tk_focusNext().focus_set(), "break"))
     bpu_combo.bind("<FocusOut>", lambda e: format_combo_date(bpu_var))
 
-    def populate_filters():
-        try:
-            with open("submeter.json", "r", encoding="utf-8") as jf:
-                data = json.load(jf)
-            filekey_values = set()
-            auth_values = set()
-            bpf_values = set()
-            bpu_values = set()
-            if isinstance(data, list):
-                for rec in data:
-                    fk = rec.get("FileKey", "")
-                    if fk:
-                        filekey_values.add(fk)
-                    sub_data = rec.get("Sub_Meter", {})
-                    auth_val = sub_data.get("Auth", "")
-                    if auth_val:
-                        auth_values.add(auth_val)
-                    bpf_val = sub_data.get("Billing Period From", "")
-                    if bpf_val:
-                        bpf_values.add(bpf_val)
-                    bpu_val = sub_data.get("Billing Period Up To", "")
-                    if bpu_val:
-                        bpu_values.add(bpu_val)
-            else:
-                fk = data.get("FileKey", "")
-                if fk:
-                    filekey_values.add(fk)
-                sub_data = data.get("Sub_Meter", {})
-                auth_val = sub_data.get("Auth", "")
-                if auth_val:
-                    auth_values.add(auth_val)
-                bpf_val = sub_data.get("Billing Period From", "")
-                if bpf_val:
-                    bpf_values.add(bpf_val)
-                bpu_val = sub_data.get("Billing Period Up To", "")
-                if bpu_val:
-                    bpu_values.add(bpu_val)
-            filekey_list = sorted(filekey_values)
-            auth_list = sorted(auth_values)
-            bpf_list = sorted(bpf_values)
-            bpu_list = sorted(bpu_values)
+    @profiler.timed("populate_filters")
+    def populate_filters(on_ready=None):
+        def apply(lists):
+            filekey_list, auth_list, bpf_list, bpu_list = lists
             filekey_combo['values'] = filekey_list
             auth_combo['values'] = auth_list
             bpf_combo['values'] = bpf_list
@@ -429,13 +3767,44 @@ def setup_sub_metering(container):
                 bpf_combo.set(bpf_list[0])
             if bpu_list:
                 bpu_combo.set(bpu_list[0])
-        except Exception as e:
+            filter_edited.clear()  # the values picked above are not the operator's
+            if on_ready:
+                on_ready()
+
+        def failed(e):
             print("Error populating filters:", e)
             filekey_combo['values'] = []
             auth_combo['values'] = []
             bpf_combo['values'] = []
             bpu_combo['values'] = []
 
+        run_io("Reading submeter.json", read_filter_values, on_done=apply, on_error=failed)
+
+    @profiler.timed("show_record")
+    def show_record(record):
+        sub_data = record.get("Sub_Meter", {})
+        for key in sub_vars:
+            if key in sub_data:
+                sub_vars[key].set(sub_data[key])
+        graph.flush()  # recompute now so the stored totals below are what stays on screen
+        total_consumption.set(sub_data.get("Total Actual Consumption (kWh)", ""))
+        total_amount.set(sub_data.get("Total Amount", ""))
+        auth_entry.delete(0, tk.END)
+        auth_entry.insert(0, sub_data.get("Auth", ""))
+
+    def open_browsed_record(record):
+        filekey_combo.set(record.get("FileKey", ""))
+        auth_combo.set(record_field(record, "Auth"))
+        bpf_combo.set(record_field(record, "Billing Period From"))
+        bpu_combo.set(record_field(record, "Billing Period Up To"))
+        show_record(record)
+
+    # Record browser pane under the filters
+    container.rowconfigure(4, weight=1)
+    browser = RecordBrowser(container, open_browsed_record)
+    browser.frame.grid(row=4, column=0, sticky="nsew", padx=5, pady=5)
+
+    @profiler.timed("load_json")
     def load_json():
         f_filter = filekey_combo.get().strip()
         a_filter = auth_combo.get().strip()
@@ -444,40 +3813,20 @@ def setup_sub_metering(container):
         if not (f_filter and a_filter and bpf_filter and bpu_filter):
             messagebox.showerror("Load JSON", "All filter fields must be filled.")
             return
-        try:
-            with open("submeter.json", "r", encoding="utf-8") as jf:
-                data = json.load(jf)
-            record = None
-            if isinstance(data, list):
-                for rec in data:
-                    if (rec.get("FileKey", "") == f_filter and
-                            rec.get("Sub_Meter", {}).get("Auth", "") == a_filter and
-                            rec.get("Sub_Meter", {}).get("Billing Period From", "") == bpf_filter and
-                            rec.get("Sub_Meter", {}).get("Billing Period Up To", "") == bpu_filter):
-                        record = rec
-                        break
-            else:
-                if (data.get("FileKey", "") == f_filter and
-                        data.get("Sub_Meter", {}).get("Auth", "") == a_filter and
-                        data.get("Sub_Meter", {}).get("Billing Period From", "") == bpf_filter and
-                        data.get("Sub_Meter", {}).get("Billing Period Up To", "") == bpu_filter):
-                    record = data
+
+        def apply(record):
             if record is None:
                 messagebox.showinfo("Load JSON", "No record matches the provided filters.")
                 return
-            sub_data = record.get("Sub_Meter", {})
-            for key in sub_vars:
-                if key in sub_data:
-                    sub_vars[key].set(sub_data[key])
-            total_consumption.set(sub_data.get("Total Actual Consumption (kWh)", ""))
-            total_amount.set(sub_data.get("Total Amount", ""))
-            auth_entry.delete(0, tk.END)
-            auth_entry.insert(0, sub_data.get("Auth", ""))
+            show_record(record)
             messagebox.showinfo("Load JSON", "Record loaded successfully.")
-        except Exception as e:
-            messagebox.showerror("Load JSON", f"Error loading JSON:\n{e}")
 
+        run_io("Loading record", find_record, f_filter, a_filter, bpf_filter, bpu_filter,
+               on_done=apply, on_error=lambda e: messagebox.showerror("Load JSON", f"Error loading JSON:\n{e}"))
+
+    @profiler.timed("save_sub_metering")
     def save_sub_metering():
+        graph.flush()
         sub_meter_data = {
             "Auth": auth_entry.get(),
             "Billing Period From": sub_vars["Billing Period From"].get(),
@@ -494,58 +3843,41 @@ def setup_sub_metering(container):
             "FileKey": file_key,
             "Sub_Meter": sub_meter_data
         }
-        try:
-            records = []
-            if os.path.exists("submeter.json"):
-                with open("submeter.json", "r", encoding="utf-8") as jf:
-                    try:
-                        data = json.load(jf)
-                        if isinstance(data, list):
-                            records = data
-                        else:
-                            records = [data]
-                    except Exception:
-                        records = []
-            records.append(new_record)
-            with open("submeter.json", "w", encoding="utf-8") as jf:
-                json.dump(records, jf, indent=4)
-            messagebox.showinfo("Save", "Record appended to submeter.json")
-            populate_filters()
+
+        def select_new_record():
             filekey_combo.set(new_record["FileKey"])
             auth_combo.set(new_record["Sub_Meter"]["Auth"])
             bpf_combo.set(new_record["Sub_Meter"]["Billing Period From"])
             bpu_combo.set(new_record["Sub_Meter"]["Billing Period Up To"])
             load_json()
-        except Exception as e:
-            messagebox.showerror("Save", f"Failed to save:\n{e}")
+
+        def saved(replaced):
+            messagebox.showinfo("Save", "Record updated in submeter.json" if replaced else
+                                "Record appended to submeter.json")
+            populate_filters(on_ready=select_new_record)
+            browser.refresh()
+
+        run_io("Saving record", profiler.timed("save_sub_metering.io")(submeter_index.append), new_record,
+               on_done=saved, on_error=lambda e: messagebox.showerror("Save", f"Failed to save:\n{e}"))
 
     loadjson_btn = ttk.Button(filter_frame, text="Load JSON", command=load_json)
     loadjson_btn.grid(row=1, column=6, padx=2, pady=2, sticky="w")
     save_btn = ttk.Button(filter_frame, text="Save", command=save_sub_metering)
     save_btn.grid(row=1, column=7, padx=2, pady=2, sticky="w")
 
-    # --- "Copy" Button (Text) ---
-    def copy_sub_metering_data():
-        lines = []
-        lines.append("=== Top Details ===")
-        top_items = {}
-        for key, var in sub_detail_vars_global.items():
-            top_items[key] = var.get()
+    def current_statement_items():
+        graph.flush()
+        top_items = {key: var.get() for key, var in sub_detail_vars_global.items()}
         top_items["Authorized"] = auth_entry.get()
-        max_key_len = max(len(k) for k in top_items.keys())
-        for key, value in top_items.items():
-            lines.append(f"{key:<{max_key_len}} : {value}")
-        lines.append("")
-        lines.append("=== Sub-Metering Details ===")
-        sub_items = {}
-        for key, var in sub_vars.items():
-            sub_items[key] = var.get()
+        sub_items = {key: var.get() for key, var in sub_vars.items()}
         sub_items["Total Actual Consumption (kWh)"] = total_consumption.get()
         sub_items["Total Amount"] = total_amount.get()
-        max_key_len_sub = max(len(k) for k in sub_items.keys())
-        for key, value in sub_items.items():
-            lines.append(f"{key:<{max_key_len_sub}} : {value}")
-        data_str = "\n".join(lines)
+        return top_items, sub_items
+
+    # --- "Copy" Button (Text) ---
+    @profiler.timed("copy_sub_metering_data")
+    def copy_sub_metering_data():
+        data_str = "\n".join(statement_lines(*current_statement_items()))
         container.clipboard_clear()
         container.clipboard_append(data_str)
         messagebox.showinfo("Copy", "Sub-Metering data copied to clipboard.")
@@ -554,87 +3886,14 @@ def setup_sub_metering(container):
     copy_btn.grid(row=1, column=8, padx=2, pady=2, sticky="w")
 
     # --- "Copy as Image" Button ---
+    @profiler.timed("copy_sub_metering_as_image")
     def copy_sub_metering_as_image():
-        import io
         try:
             import win32clipboard
         except ImportError:
             messagebox.showerror("Copy as Image", "pywin32 is required for copying images to the clipboard.")
             return
-
-        # --- Build the text for each section ---
-
-        # Top Details section
-        top_heading = "=== Top Details ==="
-        top_items = {key: var.get() for key, var in sub_detail_vars_global.items()}
-        top_items["Authorized"] = auth_entry.get()
-        max_key_len_top = max(len(k) for k in top_items.keys())
-        top_lines = [f"{key:<{max_key_len_top}} : {value}" for key, value in top_items.items()]
-
-        # Sub-Metering section
-        sub_heading = "=== Sub-Metering Details ==="
-        sub_items = {key: var.get() for key, var in sub_vars.items()}
-        sub_items["Total Actual Consumption (kWh)"] = total_consumption.get()
-        sub_items["Total Amount"] = total_amount.get()
-        max_key_len_sub = max(len(k) for k in sub_items.keys())
-        sub_lines = [f"{key:<{max_key_len_sub}} : {value}" for key, value in sub_items.items()]
-
-        # Combine the sections with a blank line between them
-        lines = []
-        lines.append(top_heading)
-        lines.extend(top_lines)
-        lines.append("")  # Blank line for spacing
-        lines.append(sub_heading)
-        lines.extend(sub_lines)
-
-        # --- Set up font and color ---
-        from PIL import Image, ImageDraw, ImageFont
-        font_size = 20
-        try:
-            # Use a monospaced font for perfect alignment (Courier New)
-            font = ImageFont.truetype("Courier New.ttf", font_size)
-        except IOError:
-            try:
-                font = ImageFont.truetype("arial.ttf", font_size)
-            except IOError:
-                font = ImageFont.load_default()
-        background_color = "#FFFFFF"  # White background
-        text_color = "#000000"  # Black text
-
-        # --- Calculate the required image size ---
-        dummy_img = Image.new("RGB", (1, 1))
-        draw = ImageDraw.Draw(dummy_img)
-        max_line_width = 0
-        line_sizes = []
-        for line in lines:
-            # Get the size of each line using textbbox
-            bbox = draw.textbbox((0, 0), line, font=font)
-            w = bbox[2] - bbox[0]
-            h = bbox[3] - bbox[1]
-            line_sizes.append((w, h))
-            if w > max_line_width:
-                max_line_width = w
-
-        line_spacing = 10  # Extra space between lines
-        total_height = sum(h for _, h in line_sizes) + line_spacing * (len(lines) - 1)
-
-        padding = 20
-        img_width = max_line_width + 2 * padding
-        img_height = total_height + 2 * padding
-
-        # --- Create the final image and draw the text ---
-        img = Image.new("RGB", (img_width, img_height), color=background_color)
-        draw = ImageDraw.Draw(img)
-        y = padding
-        for i, line in enumerate(lines):
-            w, h = line_sizes[i]
-            # If the line is a section heading (starts and ends with ===), center it.
-            if line.startswith("===") and line.endswith("==="):
-                x = padding + (max_line_width - w) // 2
-            else:
-                x = padding
-            draw.text((x, y), line, fill=text_color, font=font)
-            y += h + line_spacing
+        img = get_statement_renderer().render(statement_lines(*current_statement_items()))
 
         # --- Save the image to a bytes buffer and copy it to the clipboard ---
         output = io.BytesIO()
@@ -653,11 +3912,455 @@ def setup_sub_metering(container):
     copy_image_btn = ttk.Button(filter_frame, text="Copy as Image", command=copy_sub_metering_as_image)
     copy_image_btn.grid(row=1, column=9, padx=2, pady=2, sticky="w")
 
+    # --- "Export Slips" Button: one PNG per record of the selected FileKey (all records if blank) ---
+    @profiler.timed("export_slips")
+    def export_slips():
+        out_dir = filedialog.askdirectory(title="Export statement images to")
+        if not out_dir:
+            return
+        f_filter = filekey_combo.get().strip()
+        bill = {key: var.get() for key, var in detail_vars.items()}
+
+        def export():
+            records = find_records(submeter_index, submeter_archive, {"FileKey": f_filter} if f_filter else {})
+            return export_statement_images(records, out_dir, bill)
+
+        run_io("Exporting statements", export,
+               on_done=lambda n: messagebox.showinfo("Export Slips", f"Exported {n} statement image(s) to:\n{out_dir}"),
+               on_error=lambda e: messagebox.showerror("Export Slips", f"Failed to export:\n{e}"))
+
+    export_btn = ttk.Button(filter_frame, text="Export Slips", command=export_slips)
+    export_btn.grid(row=1, column=10, padx=2, pady=2, sticky="w")
+
+    # --- "Export..." Button: the records matching the FileKey/Auth/period fields to CSV, TSV or JSON Lines ---
+    @profiler.timed("export_records")
+    def export_filtered():
+        # Only fields the operator typed or picked filter; blank ones and populate_filters' picks don't
+        chosen = {field: var.get().strip() for field, var in filter_vars.items()
+                  if field in filter_edited and var.get().strip()}
+        start, end = chosen.pop("From", None), chosen.pop("Up To", None)
+        for value in (start, end):
+            if value and not date_ordinal(value):
+                messagebox.showerror("Export", f"Not a date: {value}")
+                return
+        filters = chosen
+        summary = [f"{field} {value}" for field, value in filters.items()]
+        if start or end:
+            summary.append(f"periods within {start or '...'} to {end or '...'}")
+        summary = ", ".join(summary) or "all records"
+
+        def confirm(n):
+            if not n:
+                messagebox.showwarning("Export", f"No records match: {summary}")
+                return
+            if not messagebox.askokcancel("Export", f"Export {n} record(s)?\n{summary}"):
+                return
+            fn = filedialog.asksaveasfilename(title="Export sub-meter records", defaultextension=".csv",
+                                              filetypes=[("CSV Files", "*.csv"), ("TSV Files", "*.tsv"),
+                                                         ("JSON Lines", "*.jsonl")])
+            if not fn:
+                return
+            run_io("Exporting records", export_records, fn, submeter_index, None, filters, start, end,
+                   on_done=lambda n: messagebox.showinfo("Export", f"Exported {n} record(s) to:\n{fn}"),
+                   on_error=lambda e: messagebox.showerror("Export", f"Failed to export:\n{e}"))
+
+        run_io("Counting records", count_export_rows, submeter_index, filters, start, end, on_done=confirm,
+               on_error=lambda e: messagebox.showerror("Export", f"Failed to count the records:\n{e}"))
+
+    export_records_btn = ttk.Button(filter_frame, text="Export...", command=export_filtered)
+    export_records_btn.grid(row=1, column=12, padx=2, pady=2, sticky="w")
+
+    def allocate_main_bill():
+        # Shares the TOTAL Bill above across every sub-meter saved under the same FileKey
+        graph.flush()
+        file_key = (detail_vars["Consumer Name"].get() + "_" +
+                    detail_vars["Billing Period From"].get() + "_" +
+                    detail_vars["Billing Period Up To"].get())
+        main_total = parse_amount(detail_vars["TOTAL Bill"].get())
+        main_kwh = parse_reading(detail_vars["Total Actual Consumption (kWh)"].get())
+        if main_total is None:
+            messagebox.showerror("Allocate Bill", "Enter the TOTAL Bill of the main meter first.")
+            return
+        win = tk.Toplevel(container)
+        win.title(f"Allocation - {file_key}")
+        mode_var = tk.StringVar(value=ALLOCATION_MODES[0])
+        top = ttk.Frame(win, padding=5)
+        top.pack(fill="x")
+        ttk.Label(top, text="Common area / system loss:").pack(side="left")
+        ttk.Combobox(top, textvariable=mode_var, values=ALLOCATION_MODES, state="readonly",
+                     width=14).pack(side="left", padx=5)
+        summary_var = tk.StringVar()
+        ttk.Label(top, textvariable=summary_var).pack(side="left", padx=10)
+        columns = ("Auth", "Metered kWh", "Allocated kWh", "Amount")
+        tree = ttk.Treeview(win, columns=columns, show="headings", height=18)
+        for c in columns:
+            tree.heading(c, text=c)
+            tree.column(c, width=140 if c == "Auth" else 110, anchor="w" if c == "Auth" else "e")
+        tree.pack(fill="both", expand=True, padx=5, pady=5)
+
+        def show(rows):
+            if not win.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for auth, kwh, basis, amount in rows:
+                tree.insert("", "end", values=(auth, f"{kwh:,.2f}", f"{basis:,.2f}", f"{amount:,.2f}"))
+            metered = sum(row[1] for row in rows)
+            tree.insert("", "end", values=("TOTAL", f"{metered:,.2f}", f"{sum(row[2] for row in rows):,.2f}",
+                                           f"{sum(row[3] for row in rows):,.2f}"))
+            summary_var.set(f"{len([r for r in rows if r[0] != 'Common Area'])} sub-meter(s), "
+                            f"main {main_kwh:,.2f} kWh / {main_total:,.2f}")
+
+        def allocate(*_):
+            mode = mode_var.get()
+
+            def work():
+                records = find_records(submeter_index, submeter_archive, {"FileKey": file_key})
+                return allocate_records(records, main_total, main_kwh, mode)
+
+            run_io("Allocating bill", work, on_done=show,
+                   on_error=lambda e: messagebox.showerror("Allocate Bill", f"Failed to allocate:\n{e}", parent=win))
+
+        mode_var.trace_add("write", allocate)
+        allocate()
+
+    allocate_btn = ttk.Button(filter_frame, text="Allocate Bill", command=allocate_main_bill)
+    allocate_btn.grid(row=1, column=11, padx=2, pady=2, sticky="w")
+
     populate_filters()
+    browser.refresh()
+
+
+# --- Analytics Tab ---
+ANALYTICS_VIEWS = {
+    # view -> (columns, query on ConsumptionRollups(start, end, auth))
+    "Top Consumers": (("Auth", "kWh", "Amount", "Records"),
+                      lambda r, start, end, auth: r.top_consumers(start, end, limit=50)),
+    "Month-over-Month": (("Month", "Auth", "kWh", "Previous kWh", "Change %"),
+                         lambda r, start, end, auth: r.month_over_month(auth, start, end)),
+    "Monthly Totals": (("Month", "kWh", "Amount", "Records"),
+                       lambda r, start, end, auth: [row for row in r.monthly_totals()
+                                                    if (not start or row[0] >= start) and (not end or row[0] <= end)]),
+    "Main Bills": (("FileKey", "kWh", "Amount", "Records"),
+                   lambda r, start, end, auth: r.file_key_totals()),
+}
+
+
+@profiler.timed("analytics.io")
+def read_analytics(view, start, end, auth):
+    submeter_index.refresh()
+    query = ANALYTICS_VIEWS[view][1]
+    return submeter_index.with_rollups(lambda r: (r.months(), query(r, start, end, auth)))
+
+
+def analytics_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return value
+
+
+def setup_analytics(container):
+    container.columnconfigure(0, weight=1)
+    container.rowconfigure(1, weight=1)
+    controls = ttk.Frame(container, padding=5)
+    controls.grid(row=0, column=0, sticky="ew")
+    view_var = tk.StringVar(value="Top Consumers")
+    start_var, end_var, auth_var = tk.StringVar(), tk.StringVar(), tk.StringVar()
+    ttk.Label(controls, text="View:").grid(row=0, column=0, sticky="w")
+    ttk.Combobox(controls, textvariable=view_var, values=list(ANALYTICS_VIEWS), state="readonly",
+                 width=18).grid(row=0, column=1, padx=5)
+    ttk.Label(controls, text="From:").grid(row=0, column=2, sticky="w")
+    start_combo = ttk.Combobox(controls, textvariable=start_var, width=9)
+    start_combo.grid(row=0, column=3, padx=5)
+    ttk.Label(controls, text="To:").grid(row=0, column=4, sticky="w")
+    end_combo = ttk.Combobox(controls, textvariable=end_var, width=9)
+    end_combo.grid(row=0, column=5, padx=5)
+    ttk.Label(controls, text="Auth:").grid(row=0, column=6, sticky="w")
+    ttk.Entry(controls, textvariable=auth_var, width=14).grid(row=0, column=7, padx=5)
+
+    table = ttk.Frame(container)
+    table.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
+    table.columnconfigure(0, weight=1)
+    table.rowconfigure(0, weight=1)
+    tree = ttk.Treeview(table, show="headings")
+    tree.grid(row=0, column=0, sticky="nsew")
+    scroll = ttk.Scrollbar(table, orient="vertical", command=tree.yview)
+    scroll.grid(row=0, column=1, sticky="ns")
+    tree.configure(yscrollcommand=scroll.set)
+
+    def show(view, result):
+        months, rows = result
+        start_combo['values'] = months
+        end_combo['values'] = months
+        columns = ANALYTICS_VIEWS[view][0]
+        tree.delete(*tree.get_children())
+        tree.configure(columns=columns)
+        for c in columns:
+            tree.heading(c, text=c)
+            tree.column(c, width=300 if c == "FileKey" else 110,
+                        anchor="w" if c in ("FileKey", "Auth", "Month") else "e")
+        for row in rows:
+            tree.insert("", "end", values=[analytics_cell(v) for v in row])
+
+    def refresh(*_):
+        view = view_var.get()
+        run_io("Reading analytics", read_analytics, view, start_var.get().strip(), end_var.get().strip(),
+               auth_var.get().strip(), on_done=lambda result: show(view, result),
+               on_error=lambda e: print("Error reading analytics:", e))
+
+    def this_quarter():
+        # Quarter of the latest billed month
+        months = start_combo['values']
+        if not months:
+            return
+        latest = months[-1]
+        first = month_shift(latest, -((int(latest[5:7]) - 1) % 3))
+        start_var.set(first)
+        end_var.set(month_shift(first, 2))
+        refresh()
+
+    ttk.Button(controls, text="This Quarter", command=this_quarter).grid(row=0, column=8, padx=5)
+    ttk.Button(controls, text="Refresh", command=refresh).grid(row=0, column=9, padx=5)
+    view_var.trace_add("write", refresh)
+    refresh()
+    return refresh
+
+
+# --- Account Workspace ---
+WORKSPACE_FORMS = 3  # form widget sets built at most; further open accounts take turns with them
+workspace = None  # Workspace created by start_app
+
+
+class Account:
+    # One open bill CSV: its model (parsed in the background) and the notebook page showing it
+    def __init__(self, path, page, label):
+        self.path = path
+        self.page = page
+        self.label = label  # "Loading..." / error text, shown until a form is bound
+        self.model = None
+        self.form = None
+
+
+class AccountForm:
+    # One Bill Detail form widget set. It is a child of the notebook and packed into whichever
+    # account page it is bound to, so the same widgets can serve any tab.
+    def __init__(self, workspace):
+        nb = workspace.nb
+        self.workspace = workspace
+        self.account = None
+        self.frame = ttk.Frame(nb, padding=10)
+        self.frame.columnconfigure(1, weight=1)
+        self.vars = {f: tk.StringVar() for f in BILL_FORM_FIELDS}
+        self.graph = CalcGraph(nb.winfo_toplevel())
+        for r, f in enumerate(BILL_FORM_FIELDS):
+            ttk.Label(self.frame, text=f).grid(row=r, column=0, sticky="w", padx=2, pady=2)
+            state = "readonly" if f == "Total Actual Consumption (kWh)" else "normal"
+            ent = ttk.Entry(self.frame, textvariable=self.vars[f], state=state, width=40)
+            ent.grid(row=r, column=1, sticky="ew", padx=2, pady=2)
+            if f in BILL_DATE_FIELDS:
+                ent.bind("<FocusOut>", lambda e, var=self.vars[f]: convert_date_strvar(e, var))
+            if state != "readonly":
+                ent.bind("<Return>", on_enter)
+        prev_cell = self.graph.number(self.vars["Previous kWh Reading"])
+        curr_cell = self.graph.number(self.vars["Current kWh Reading"])
+        self.graph.derive(lambda p, c: c - p, prev_cell, curr_cell,
+                          output=lambda cons: self.vars["Total Actual Consumption (kWh)"].set(consumption_text(cons)))
+        buttons = ttk.Frame(self.frame)
+        buttons.grid(row=len(BILL_FORM_FIELDS), column=0, columnspan=2, sticky="w", pady=5)
+        ttk.Button(buttons, text="Save as CSV",
+                   command=lambda: save_bill_form(self.values())).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Send to Sub-Metering", command=self.send).pack(side="left", padx=5)
+        ttk.Button(buttons, text="Close", command=lambda: workspace.close(self.account)).pack(side="left", padx=5)
+
+    def values(self):
+        self.graph.flush()
+        return {f: var.get() for f, var in self.vars.items()}
+
+    def bind(self, account):
+        self.account = account
+        account.form = self
+        for f, var in self.vars.items():
+            var.set(account.model.get(f, ""))
+        self.graph.flush()
+        account.label.pack_forget()
+        self.frame.pack(in_=account.page, fill="both", expand=True)
+        self.frame.lift(account.page)
+
+    def unbind(self):
+        # Edits stay with the account before the widgets move to another tab
+        account = self.account
+        if account is not None:
+            account.model.update(self.values())
+            account.form = None
+        self.account = None
+        self.frame.pack_forget()
+
+    def send(self):
+        if not sub_detail_vars_global:
+            messagebox.showinfo("Send to Sub-Metering", "Open the Sub-Metering tab first.")
+            return
+        values = self.values()
+        for key, var in sub_detail_vars_global.items():
+            if key in values:
+                var.set(values[key])
+
+
+class Workspace:
+    # Many bill CSVs open side by side as notebook tabs. A tab gets widgets only when viewed:
+    # at most WORKSPACE_FORMS form sets exist and the least recently viewed tab gives up its set.
+    # Pages of closed tabs are kept for the next account opened.
+    def __init__(self, nb):
+        self.nb = nb
+        self.accounts = {}  # page widget name -> Account
+        self.forms = []  # AccountForms, least recently viewed first
+        self.free_pages = []
+        nb.bind("<<NotebookTabChanged>>", self.on_tab_changed, add="+")
+
+    def open(self, paths):
+        opened = {os.path.abspath(a.path): a for a in self.accounts.values()}
+        account = None
+        for path in paths:
+            account = opened.get(os.path.abspath(path))
+            if account is not None:
+                continue
+            if self.free_pages:
+                page, label = self.free_pages.pop()
+            else:
+                page = ttk.Frame(self.nb)
+                label = ttk.Label(page, anchor="center")
+            label.config(text=f"Loading {os.path.basename(path)}...")
+            label.pack(fill="both", expand=True)
+            account = Account(path, page, label)
+            self.accounts[str(page)] = account
+            self.nb.add(page, text=os.path.basename(path))
+            run_io("Loading " + os.path.basename(path), load_bill_model, path,
+                   on_done=lambda model, a=account: self.loaded(a, model),
+                   on_error=lambda e, a=account: self.failed(a, e))
+        if account is not None:
+            self.nb.select(account.page)
+
+    def loaded(self, account, model):
+        if self.accounts.get(str(account.page)) is not account:
+            return  # closed while loading
+        account.model = model
+        self.nb.tab(account.page, text=model.get("Consumer Name") or os.path.basename(account.path))
+        if self.nb.select() == str(account.page):
+            self.show(account)
+
+    def failed(self, account, error):
+        if self.accounts.get(str(account.page)) is account:
+            account.label.config(text=f"Failed to load {account.path}:\n{error}\n\nCtrl+W closes this tab.")
+
+    def selected(self):
+        return self.accounts.get(self.nb.select())
+
+    def on_tab_changed(self, event=None):
+        account = self.selected()
+        if account is not None and account.model is not None:
+            self.show(account)
+
+    @profiler.timed("workspace.show")
+    def show(self, account):
+        form = account.form
+        if form is None:
+            form = next((f for f in self.forms if f.account is None), None)
+            if form is None:
+                if len(self.forms) < WORKSPACE_FORMS:
+                    form = AccountForm(self)
+                else:
+                    form = self.forms[0]
+                    form.unbind()
+            form.bind(account)
+        if form in self.forms:
+            self.forms.remove(form)
+        self.forms.append(form)
+
+    def close(self, account=None):
+        account = account or self.selected()
+        if account is None:
+            return
+        if account.form is not None:
+            account.form.unbind()
+        del self.accounts[str(account.page)]
+        self.nb.forget(account.page)
+        self.free_pages.append((account.page, account.label))
+
+
+def open_accounts():
+    paths = filedialog.askopenfilenames(title="Open Bill CSVs", filetypes=[("CSV Files", "*.csv")],
+                                        initialdir=BILLING_DIR if os.path.isdir(BILLING_DIR) else None)
+    if paths and workspace is not None:
+        workspace.open(paths)
+
+
+# --- Diagnostics Window ---
+DIAGNOSTICS_REFRESH_MS = 1000
+diagnostics_window = None
+
+
+def toggle_diagnostics(root):
+    global diagnostics_window
+    if diagnostics_window is not None and diagnostics_window.winfo_exists():
+        diagnostics_window.destroy()
+        diagnostics_window = None
+        return
+    win = diagnostics_window = tk.Toplevel(root)
+    win.title("Diagnostics")
+    columns = ("operation", "calls", "p50 ms", "p95 ms", "max ms")
+    tree = ttk.Treeview(win, columns=columns, show="headings", height=16)
+    for c in columns:
+        tree.heading(c, text=c)
+        tree.column(c, width=220 if c == "operation" else 80, anchor="w" if c == "operation" else "e")
+    tree.pack(fill="both", expand=True, padx=5, pady=5)
+    startup_var = tk.StringVar()
+    ttk.Label(win, textvariable=startup_var).pack(anchor="w", padx=5)
+    profile_var = tk.StringVar()
+    ttk.Label(win, textvariable=profile_var).pack(anchor="w", padx=5)
+    buttons = ttk.Frame(win)
+    buttons.pack(fill="x", padx=5, pady=5)
+
+    def refresh():
+        if not win.winfo_exists():
+            return
+        tree.delete(*tree.get_children())
+        for name, calls, p50, p95, peak in profiler.stats():
+            fmt = lambda v: "" if v is None else f"{v:.2f}"
+            tree.insert("", "end", values=(name, calls, fmt(p50), fmt(p95), fmt(peak)))
+        startup_var.set("Startup: " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in startup_timings.items()))
+        profile_var.set(f"Last profile: {profiler.last_profile}" if profiler.last_profile else "")
+        win.after(DIAGNOSTICS_REFRESH_MS, refresh)
+
+    def export():
+        fn = filedialog.asksaveasfilename(parent=win, title="Export timings", defaultextension=".json",
+                                          filetypes=[("JSON Files", "*.json"), ("CSV Files", "*.csv")])
+        if fn:
+            profiler.export(fn)
+
+    def profile_next():
+        profiler.capture_next = True
+        messagebox.showinfo("Diagnostics", "The next action will be profiled with cProfile.", parent=win)
+
+    def show_profile():
+        if not profiler.last_report:
+            messagebox.showinfo("Diagnostics", "Nothing has been profiled yet.", parent=win)
+            return
+        report = tk.Toplevel(win)
+        report.title(os.path.basename(profiler.last_profile))
+        text = tk.Text(report, wrap="none", font=("Courier New", 9), width=120, height=30)
+        text.insert("1.0", profiler.last_report)
+        text.config(state="disabled")
+        text.pack(fill="both", expand=True)
+
+    ttk.Button(buttons, text="Export...", command=export).pack(side="left", padx=2)
+    ttk.Button(buttons, text="Profile Next Action", command=profile_next).pack(side="left", padx=2)
+    ttk.Button(buttons, text="Show Profile", command=show_profile).pack(side="left", padx=2)
+    ttk.Button(buttons, text="Reset", command=profiler.reset).pack(side="left", padx=2)
+    refresh()
 
 
 # --- Application Startup ---
-def start_app():
+def start_app(paths=()):
     root = tk.Tk()
     root.title("Bill Detail")
     root.withdraw()
@@ -682,17 +4385,230 @@ def start_app():
         root.attributes('-topmost', True)
         root.deiconify()
 
-    root.after(3000, show_main)
+    splash.update()
+    global io_executor
+    status_var = tk.StringVar(value="Ready")
+    ttk.Label(root, textvariable=status_var, anchor="w", relief="sunken").pack(side="bottom", fill="x")
+    io_executor = IOExecutor(root, status_var)
+    root.bind("<Escape>", io_executor.cancel_all)
+    root.bind_all("<F12>", lambda e: toggle_diagnostics(root))
     nb = ttk.Notebook(root)
     nb.pack(fill="both", expand=True)
+    bill_model = load_bill_model("bill_detail.csv")
     bd = ttk.Frame(nb)
     nb.add(bd, text="Bill Detail")
-    setup_gui(bd)
+    setup_gui(bd, bill_model)
     sm = ttk.Frame(nb)
     nb.add(sm, text="Sub-Metering")
-    setup_sub_metering(sm)
+    an = ttk.Frame(nb)
+    nb.add(an, text="Analytics")
+    refresh_analytics = []
+
+    def on_tab_changed(event):
+        # The Sub-Metering tab and its submeter.json scan are built on first view
+        if nb.select() == str(sm) and not sm.winfo_children():
+            started = time.perf_counter()
+            setup_sub_metering(sm, bill_model)
+            startup_timings["sub_metering_tab"] = time.perf_counter() - started
+        elif nb.select() == str(an):
+            if refresh_analytics:
+                refresh_analytics[0]()  # pick up records saved since the last view
+            else:
+                refresh_analytics.append(setup_analytics(an))
+
+    nb.bind("<<NotebookTabChanged>>", on_tab_changed)
+    global workspace
+    workspace = Workspace(nb)
+    root.bind("<Control-w>", lambda e: workspace.close())
+    if paths:
+        root.after_idle(lambda: workspace.open(paths))  # bill CSVs passed on the command line
+
+    def report_interactive():
+        startup_timings["interactive"] = time.perf_counter() - process_start
+        print(f"Time to interactive: {startup_timings['interactive'] * 1000:.0f} ms")
+        run_io("Loading NumPy", load_numpy)
+
+    startup_timings["ui_built"] = time.perf_counter() - process_start
+    root.after_idle(show_main)
+    root.after_idle(lambda: root.after_idle(report_interactive))
     root.mainloop()
+    io_executor.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Meralco billing and sub-metering")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("migrate-sqlite", help="copy submeter.json into submeter.db and use it from then on")
+    commands.add_parser("dedup", help="compact submeter.json, keeping only the latest save of each record")
+    archive = commands.add_parser("archive", help="move closed billing periods into compressed yearly segments")
+    archive.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS,
+                         help="months of periods to keep in submeter.json")
+    archive.add_argument("--codec", choices=list(ARCHIVE_CODECS), default="gzip", help="segment compression")
+    bill = commands.add_parser("bill", help="bill a CSV/JSONL of sub-meter readings without the GUI")
+    bill.add_argument("input", help="CSV or JSONL with Auth, previous/current reading and period columns")
+    bill.add_argument("--rate", type=float, help="PHP per kWh (default: Rate This Month from --bill)")
+    bill.add_argument("--bill", default="bill_detail.csv", help="bill CSV to read the rate from")
+    bill.add_argument("--components", action="store_true",
+                      help="bill each reading with the full Rate Components table of --bill")
+    bill.add_argument("--file-key", default="", help="FileKey for rows that do not carry one")
+    bill.add_argument("--output", default="-", help="JSON Lines output file (default: stdout)")
+    bill.add_argument("--save", action="store_true", help="also append the records to the sub-meter store")
+    imp = commands.add_parser("import", help="normalize and check a meter-reader dump of sub-meter readings")
+    imp.add_argument("input", help="CSV or JSONL with Auth, previous/current reading and period columns")
+    imp.add_argument("--output", default="-", help="JSON Lines report of the readings (default: stdout)")
+    imp.add_argument("--flagged-only", action="store_true", help="report only readings with anomalies")
+    imp.add_argument("--no-history", action="store_true",
+                     help="judge outliers and overlaps without the readings already in the store")
+    imp.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="readings checked per pass")
+    imp.add_argument("--save", action="store_true",
+                     help="bill the readings without anomalies (rollovers included) and append them to the store")
+    imp.add_argument("--keep-flagged", action="store_true", help="with --save, also save negative/overlap/outliers")
+    imp.add_argument("--rate", type=float, help="PHP per kWh (default: Rate This Month from --bill)")
+    imp.add_argument("--bill", default="bill_detail.csv", help="bill CSV to read the rate from")
+    imp.add_argument("--components", action="store_true", help="price with the Rate Components table of --bill")
+    imp.add_argument("--file-key", default="", help="FileKey for rows that do not carry one")
+    records = commands.add_parser("import-records", help="add saved records from another submeter.json or .jsonl")
+    records.add_argument("input", help="submeter.json (a list or one record) or a JSON Lines journal")
+    catalog = commands.add_parser("catalog", help="index the Billing folder and look up saved bills")
+    catalog.add_argument("--folder", default=BILLING_DIR, help="folder of saved bill CSVs")
+    catalog.add_argument("--consumer", help="Consumer Name")
+    catalog.add_argument("--account", help="Account Number (CAN)")
+    catalog.add_argument("--meter", help="Electric Meter Number")
+    catalog.add_argument("--period", help="a date inside the billing period (DD/MM/YYYY)")
+    export = commands.add_parser("export", help="stream stored sub-meter records to a CSV, TSV or JSON Lines report")
+    export.add_argument("output", help="report file; .csv, .tsv or .jsonl picks the format ('-' for stdout)")
+    export.add_argument("--file-key", help="only records of this FileKey")
+    export.add_argument("--auth", help="only records of this Auth")
+    export.add_argument("--start", help="only periods starting on or after this date (DD/MM/YYYY)")
+    export.add_argument("--end", help="only periods ending on or before this date (DD/MM/YYYY)")
+    export.add_argument("--columns", help="comma-separated Sub-Metering labels, in output order (default: all)")
+    export.add_argument("--format", choices=sorted(set(EXPORT_FORMATS.values())), help="override the extension")
+    slips = commands.add_parser("export-images", help="render a PNG statement per stored sub-meter record")
+    slips.add_argument("out_dir", help="folder for the PNG files")
+    slips.add_argument("--file-key", help="only records of this FileKey")
+    slips.add_argument("--auth", help="only records of this Auth")
+    slips.add_argument("--workers", type=int, help="render processes (default: CPU count)")
+    serve = commands.add_parser("serve", help="run the local JSON API for the building-management system")
+    serve.add_argument("--host", default=API_HOST, help="interface to listen on (default: localhost only)")
+    serve.add_argument("--port", type=int, default=API_PORT, help="TCP port")
+    serve.add_argument("--rate", type=float, help="PHP per kWh (default: Rate This Month from --bill)")
+    serve.add_argument("--bill", default="bill_detail.csv", help="bill CSV to read the rate from")
+    serve.add_argument("--components", action="store_true", help="price with the Rate Components table of --bill")
+    allocate = commands.add_parser("allocate", help="share a main bill across the sub-meters of its FileKey")
+    allocate.add_argument("file_key", help="FileKey of the main bill (Consumer_From_UpTo)")
+    allocate.add_argument("--total", type=float, help="main bill amount (default: TOTAL Bill from --bill)")
+    allocate.add_argument("--kwh", type=float, help="main meter kWh (default: consumption from --bill)")
+    allocate.add_argument("--bill", default="bill_detail.csv", help="bill CSV to read the defaults from")
+    allocate.add_argument("--mode", choices=ALLOCATION_MODES, default=ALLOCATION_MODES[0],
+                          help="how the common-area/system-loss kWh are shared")
+    history = commands.add_parser("history-build", help="write the binary reading history from the sub-meter store")
+    history.add_argument("--output", default=READING_HISTORY, help="history file to write")
+    history = commands.add_parser("history-query", help="print one meter's readings from the history file")
+    history.add_argument("auth", help="Auth of the sub-meter")
+    history.add_argument("--start", help="first period start date (DD/MM/YYYY)")
+    history.add_argument("--end", help="last period start date (DD/MM/YYYY)")
+    history.add_argument("--history", default=READING_HISTORY, help="history file to read")
+    history = commands.add_parser("history-export", help="write the history file back out as submeter.json records")
+    history.add_argument("output", help="JSON file to write")
+    history.add_argument("--history", default=READING_HISTORY, help="history file to read")
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in list(commands.choices) + ["-h", "--help"]:
+        # Double-click, or associated files passed by the installer: each bill CSV opens as an account tab
+        start_app([a for a in argv if a.lower().endswith(".csv") and os.path.isfile(a)])
+        return 0
+    args = parser.parse_args(argv)
+    load_numpy()
+    if args.command == "migrate-sqlite":
+        try:
+            _, n = migrate_json_to_sqlite(submeter_store)
+        except FileExistsError as e:
+            print(e)
+            return 1
+        print(f"Migrated {n} records to {SUBMETER_DB}")
+    elif args.command == "dedup":
+        if isinstance(submeter_index.get(), SqliteRecordIndex):
+            print(f"{SUBMETER_DB} keeps one row per record already")  # deduplicated when opened
+            return 0
+        submeter_store.keep_months = None  # only deduplicate; archiving is its own command
+        before = len(submeter_store.load())
+        after = submeter_store.compact()
+        print(f"Kept {after} of {before} records ({before - after} superseded versions removed)")
+    elif args.command == "archive":
+        if isinstance(submeter_index.get(), SqliteRecordIndex):
+            print(f"Archiving works on submeter.json; {SUBMETER_DB} is in use")
+            return 1
+        submeter_archive.codec = args.codec
+        submeter_store.keep_months = args.keep_months
+        before = len(submeter_store.load())
+        kept = submeter_store.compact()
+        print(f"Kept {kept} of {before} records in {SUBMETER_JSON}; "
+              f"{len(submeter_archive.segment_paths())} archive segment(s) in {ARCHIVE_DIR}")
+    elif args.command == "bill":
+        return run_batch_billing(args)
+    elif args.command == "import":
+        return run_reading_import(args)
+    elif args.command == "import-records":
+        return run_record_import(args)
+    elif args.command == "catalog":
+        bills = BillCatalog(args.folder)
+        parsed, removed, total = bills.scan()
+        print(f"{total} bills indexed ({parsed} parsed, {removed} removed)", file=sys.stderr)
+        for path, bill in bills.query(args.consumer, args.account, args.meter, args.period):
+            print("\t".join([path] + [bill.get(f, "") for f in ("Consumer Name", "Account Number (CAN)",
+                                                                 "Billing Period From", "Billing Period Up To",
+                                                                 "TOTAL Bill")]))
+    elif args.command == "export":
+        filters = {f: v for f, v in (("FileKey", args.file_key), ("Auth", args.auth)) if v}
+        fields = [c.strip() for c in args.columns.split(",")] if args.columns else None
+        try:
+            n = export_records(args.output, submeter_index, fields, filters, args.start, args.end, args.format)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        except BrokenPipeError:
+            return 0  # output piped into head/more
+        print(f"Exported {n} records to {args.output}", file=sys.stderr)
+    elif args.command == "export-images":
+        filters = {f: v for f, v in (("FileKey", args.file_key), ("Auth", args.auth)) if v}
+        records = find_records(submeter_index, submeter_archive, filters)
+        n = export_statement_images(records, args.out_dir, load_bill_model(), args.workers)
+        print(f"Exported {n} statement images to {args.out_dir}")
+    elif args.command == "serve":
+        return run_api_server(args)
+    elif args.command == "allocate":
+        bill = load_bill_model(args.bill) if args.total is None or args.kwh is None else {}
+        main_total = args.total if args.total is not None else parse_amount(bill.get("TOTAL Bill", ""))
+        if args.kwh is not None:
+            main_kwh = args.kwh
+        else:
+            main_kwh = (parse_reading(bill.get("Current kWh Reading") or 0) -
+                        parse_reading(bill.get("Previous kWh Reading") or 0))
+        if main_total is None:
+            print(f"No TOTAL Bill in {args.bill}; pass --total")
+            return 1
+        records = find_records(submeter_index, submeter_archive, {"FileKey": args.file_key})
+        for auth, kwh, basis, amount in allocate_records(records, main_total, main_kwh, args.mode):
+            print(f"{auth}\t{kwh:.2f}\t{basis:.2f}\t{amount:.2f}")
+    elif args.command == "history-build":
+        n = write_reading_history(find_records(submeter_index, submeter_archive, {}), args.output)
+        print(f"Wrote {n} readings to {args.output}")
+    elif args.command in ("history-query", "history-export"):
+        try:
+            readings = ReadingHistory(args.history)
+        except (OSError, ValueError) as e:
+            print(e)
+            return 1
+        if args.command == "history-query":
+            for rec in readings.records(args.auth, args.start, args.end):
+                print(json.dumps(rec))
+        else:
+            with open(args.output, "w", encoding="utf-8") as jf:
+                json.dump(list(readings.records()), jf, indent=4)
+            print(f"Exported {len(readings)} readings to {args.output}")
+        readings.close()
+    return 0
 
 
 if __name__ == "__main__":
-    start_app()
+    multiprocessing.freeze_support()  # statement export workers in the bundled EXE
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import argparse, csv, json, os, platform, random, shutil, statistics, sys, tempfile, time
+from datetime import date, timedelta
+
+import Meralco as M
+
+# Benchmarks for the hot paths of Meralco.py on synthetic data, run headless.
+# Usage: python benchmark.py --sizes 1000 10000 100000 --output bench.json
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+BILL_FILES = 500
+REPEATS = 5
+BILL_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bill_detail.csv")
+FIRST_NAMES = ("Maria", "Jose", "Juan", "Ana", "Marivic", "Ramon", "Liza", "Eduardo", "Grace", "Noel")
+LAST_NAMES = ("Santos", "Reyes", "Cruz", "Bautista", "Gelbolingo", "Garcia", "Mendoza", "Torres", "Cipriano")
+
+
+# --- Synthetic Data ---
+def fmt_date(d):
+    return d.strftime("%d-%b-%Y")
+
+
+def synthetic_records(n, seed=7):
+    # Buildings of 5-60 tenants billed monthly; a few corrected readings are saved twice
+    rng = random.Random(seed)
+    records = []
+    start = date(2019, 1, 1)
+    while len(records) < n:
+        consumer = f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.randint(1, 999)}"
+        tenants = [f"{rng.choice(FIRST_NAMES).upper()}{rng.randint(1, 99)}" for _ in range(rng.randint(5, 60))]
+        readings = {t: rng.randint(1000, 30000) for t in tenants}
+        month = start + timedelta(days=rng.randint(0, 60))
+        for _ in range(rng.randint(6, 72)):
+            bill_from, bill_to = month, month + timedelta(days=29)
+            file_key = f"{consumer}_{fmt_date(bill_from)}_{fmt_date(bill_to)}"
+            for tenant in tenants:
+                prev = readings[tenant]
+                curr = prev + max(0, int(rng.gauss(180, 90)))
+                readings[tenant] = curr
+                sub_from = bill_from + timedelta(days=rng.randint(0, 5))
+                rec = {
+                    "FileKey": file_key,
+                    "Sub_Meter": {
+                        "Auth": tenant,
+                        "Billing Period From": fmt_date(sub_from),
+                        "Previous kWh Reading": f"{prev:,}",
+                        "Billing Period Up To": fmt_date(sub_from + timedelta(days=30)),
+                        "Current kWh Reading": str(curr),
+                        "Total Actual Consumption (kWh)": f"{curr - prev:.2f}",
+                        "Total Amount": f"{(curr - prev) * 13.22:.2f}"
+                    }
+                }
+                records.append(rec)
+                if rng.random() < 0.01:
+                    records.append(rec)
+                if len(records) >= n:
+                    return records
+            month = bill_to + timedelta(days=1)
+    return records
+
+
+def write_submeter_json(path, records):
+    with open(path, "w", encoding="utf-8") as jf:
+        json.dump(records, jf, indent=4)
+
+
+def write_bill_files(folder, count, template=BILL_TEMPLATE, seed=11):
+    rng = random.Random(seed)
+    with open(template, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    os.makedirs(folder, exist_ok=True)
+    for i in range(count):
+        bill_from = date(2020, 1, 1) + timedelta(days=rng.randint(0, 1800))
+        prev = rng.randint(1000, 50000)
+        values = {
+            "Consumer Name": f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {i}",
+            "Account Number (CAN)": str(2100000000 + i),
+            "Electric Meter Number": f"122BAC{rng.randint(0, 999999):06d}",
+            "Billing Period From": fmt_date(bill_from),
+            "Previous kWh Reading": str(prev),
+            "Billing Period Up To": fmt_date(bill_from + timedelta(days=29)),
+            "Current kWh Reading": str(prev + rng.randint(50, 900)),
+        }
+        out = [[row[0], values.get(row[0], row[1] if len(row) > 1 else "")] + row[2:] for row in rows if row]
+        with open(os.path.join(folder, f"bill_{i:05d}.csv"), "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(out)
+
+
+# --- Timing ---
+def measure(fn, repeats=REPEATS, setup=None):
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"median_ms": statistics.median(times) * 1000, "min_ms": min(times) * 1000, "runs": repeats}
+
+
+def bench_bill_file(results, workdir):
+    bill = os.path.join(workdir, "bill_detail.csv")
+    shutil.copy(BILL_TEMPLATE, bill)
+    results["load_data"] = measure(lambda: M.load_data(bill), 50)
+    results["load_specific_values"] = measure(lambda: M.load_specific_values(bill), 50)
+    results["load_bill_model"] = measure(lambda: M.load_bill_model(bill), 50)
+    results["rate_plan.compile"] = measure(lambda: M.compile_rate_plan(M.load_rate_components(bill)), 20)
+    plan = M.load_rate_plan(bill)
+    kwh = [float(k) for k in range(100000)]
+    results["rate_plan.totals_100k"] = measure(lambda: plan.totals(kwh))
+
+    folder = os.path.join(workdir, "Billing")
+    write_bill_files(folder, BILL_FILES, bill)
+    manifest = os.path.join(workdir, "catalog.json")
+
+    def cold():
+        if os.path.exists(manifest):
+            os.remove(manifest)
+        M.BillCatalog(folder, manifest).scan()
+
+    results[f"catalog.cold_scan_{BILL_FILES}"] = measure(cold, 3)
+    results[f"catalog.warm_scan_{BILL_FILES}"] = measure(lambda: M.BillCatalog(folder, manifest).scan(), 3)
+
+
+def bench_submeter(results, workdir, n, render):
+    records = synthetic_records(n)
+    json_path = os.path.join(workdir, f"submeter_{n}.json")
+    journal_path = json_path + "l"
+    write_submeter_json(json_path, records)
+    store = M.SubmeterStore(json_path, journal_path)
+    repeats = 3 if n >= 100000 else REPEATS
+
+    results["store.load"] = measure(store.load, repeats)
+    index = M.RecordIndex(store)
+
+    def cold_filters():
+        index.signature = None
+        index.refresh()
+        return [index.values(f) for f in M.RECORD_KEY_FIELDS]
+
+    results["populate_filters.cold"] = measure(cold_filters, repeats)
+    results["index.rebuild"] = measure(lambda: index.rebuild(records), repeats)
+    index.refresh()
+    results["populate_filters.warm"] = measure(lambda: (index.refresh(), [index.values(f) for f in M.RECORD_KEY_FIELDS]))
+
+    rng = random.Random(3)
+    keys = [M.record_key(rng.choice(records)) for _ in range(1000)]
+    results["lookup_x1000"] = measure(lambda: [index.lookup(*k) for k in keys])
+    auths = [k[1][:2] for k in keys[:100]]
+    results["suggest_x100"] = measure(lambda: [index.suggest("Auth", a) for a in auths])
+    results["columns.group_totals"] = measure(lambda: index.columns.group_totals("Auth", "Total Amount"))
+    results["page.sort_amount"] = measure(lambda: index.page("Total Amount", True, n // 2, 50), 1)
+    export_path = os.path.join(workdir, f"export_{n}.csv")
+    results["export_csv"] = measure(lambda: M.export_records(export_path, index), repeats)
+
+    extra = synthetic_records(100, seed=99)
+    results["append_x100"] = measure(lambda: [index.append(rec) for rec in extra], 1)
+    results["compact"] = measure(store.compact, 1)
+
+    dates = [rec["Sub_Meter"]["Billing Period From"].replace("-", "/") for rec in records[:10000]]
+    results["parse_bill_date_x10k"] = measure(lambda: [M.parse_bill_date(d) for d in dates], 3)
+
+    rows = [("", r["Sub_Meter"]["Auth"], r["Sub_Meter"]["Billing Period From"], r["Sub_Meter"]["Previous kWh Reading"],
+             r["Sub_Meter"]["Billing Period Up To"], r["Sub_Meter"]["Current kWh Reading"]) for r in records]
+    results["batch_bill"] = measure(lambda: sum(1 for _ in M.bill_readings(rows, 13.22)), repeats)
+    results["import_check"] = measure(lambda: sum(1 for _ in M.import_readings(rows)), repeats)
+
+    if render:
+        renderer = M.get_statement_renderer()
+        lines = [M.statement_lines(*M.record_statement_items(rec)) for rec in records[:50]]
+        results["render_x50"] = measure(lambda: [renderer.render(l) for l in lines], 3)
+
+
+def run(sizes, workdir, render):
+    M.load_numpy()
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "numpy": getattr(M.np, "__version__", None),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "bill": {},
+        "submeter": {},
+    }
+    bench_bill_file(report["bill"], workdir)
+    for n in sizes:
+        results = report["submeter"][str(n)] = {}
+        bench_submeter(results, workdir, n, render)
+        print(f"{n:>9} records: " + ", ".join(f"{k} {v['median_ms']:.1f} ms" for k, v in results.items()),
+              file=sys.stderr)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Meralco.py on synthetic bill and sub-meter data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="submeter.json record counts (e.g. 1000 10000 100000 1000000)")
+    parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    parser.add_argument("--workdir", help="keep generated data here instead of a temporary folder")
+    parser.add_argument("--no-render", action="store_true", help="skip the PIL image rendering benchmark")
+    args = parser.parse_args(argv)
+    render = not args.no_render
+    if render:
+        try:
+            import PIL
+        except ImportError:
+            render = False
+    workdir = args.workdir or tempfile.mkdtemp(prefix="meralco_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        report = run(args.sizes, workdir, render)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    text = json.dumps(report, indent=4)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import Meralco as M
+
+RECORD = {"FileKey": "bill_2024-05", "Sub_Meter": {
+    "Auth": "Unit 1", "Billing Period From": "Apr 10, 2024", "Previous kWh Reading": "100.00",
+    "Billing Period Up To": "May 10, 2024", "Current kWh Reading": "250.00",
+    "Total Actual Consumption (kWh)": "150.00", "Total Amount": "1,650.00"}}
+
+
+def post(api, path, body):
+    return asyncio.run(api.dispatch("POST", path, json.dumps(body).encode("utf-8")))
+
+
+def get(api, target):
+    return asyncio.run(api.dispatch("GET", target, b""))
+
+
+@pytest.fixture
+def api(tmp_path):
+    archive = M.SubmeterArchive(str(tmp_path / "archive"))
+    store = M.SubmeterStore(str(tmp_path / "submeter.json"), str(tmp_path / "submeter.jsonl"), archive=archive)
+    return M.SubmeterApi(M.RecordIndex(store), 11.0, archive), store
+
+
+@pytest.mark.parametrize("bad", [
+    {"Sub_Meter": RECORD["Sub_Meter"]},
+    dict(RECORD, FileKey=7),
+    {"FileKey": "bill_2024-05", "Sub_Meter": dict(RECORD["Sub_Meter"], Auth=None)},
+    {"FileKey": "bill_2024-05", "Sub_Meter": dict(RECORD["Sub_Meter"], **{"Total Amount": 1650.0})},
+    [RECORD, {"FileKey": "bill_2024-05", "Sub_Meter": {"Auth": ["Unit 2"]}}],
+])
+def test_bad_records_are_rejected_and_the_store_still_compacts(api, bad):
+    api, store = api
+    with pytest.raises(M.ApiError) as e:
+        post(api, "/records", bad)
+    assert e.value.status == 400
+    assert post(api, "/records", RECORD) == {"appended": 1}
+    assert store.load() == [RECORD]
+    assert store.compact() == 1
+    assert store.load() == [RECORD]
+    assert not os.path.exists(store.journal_path) or not os.path.getsize(store.journal_path)
+
+
+def test_compute_needs_readings(api):
+    api, _ = api
+    bad_bodies = ({}, {"previous": "100"}, [{"previous": "1", "current": "x"}],
+                  {"previous": 1, "current": 2, "rate": "?"})
+    for bad in bad_bodies:
+        with pytest.raises(M.ApiError) as e:
+            post(api, "/compute", bad)
+        assert e.value.status == 400
+    result = post(api, "/compute", {"previous": "100", "current": "250", "rate": 2})
+    assert result == {"consumption": 150.0, "amount": 300.0}
+
+
+@pytest.mark.parametrize("rows", [
+    [5],
+    [{"auth": "U1", "from": "garbage", "previous": "1", "to": "01-Feb-2024", "current": "2"}],
+    [{"auth": "U1", "from": "01-Jan-2024", "previous": "200", "to": "01-Feb-2024", "current": "100"}],
+    [{"auth": "U1", "from": "01-Jan-2024", "previous": "abc", "to": "01-Feb-2024", "current": "100"}],
+])
+def test_bill_save_refuses_bad_rows(api, rows):
+    api, store = api
+    with pytest.raises(M.ApiError) as e:
+        post(api, "/bill", {"rows": rows, "save": True})
+    assert e.value.status == 400
+    assert store.load() == []
+
+
+def test_bill_save_normalizes_dates(api):
+    api, store = api
+    row = {"auth": "U1", "from": "01/01/2024", "previous": "100", "to": "31/01/2024", "current": "150"}
+    post(api, "/bill", {"rows": [row], "save": True})
+    sub = store.load()[0]["Sub_Meter"]
+    assert (sub["Billing Period From"], sub["Billing Period Up To"]) == ("01-Jan-2024", "31-Jan-2024")
+    assert sub["Total Amount"] == "550.00"
+
+
+def test_records_include_archived_periods(api):
+    api, store = api
+    old = {"FileKey": "bill_2020-05", "Sub_Meter": dict(RECORD["Sub_Meter"], **{
+        "Billing Period From": "10-Apr-2020", "Billing Period Up To": "10-May-2020"})}
+    store.archive.add([old])
+    post(api, "/records", RECORD)
+    assert get(api, "/records?Auth=Unit+1") == [RECORD, old]
+    assert get(api, "/records?Auth=Unit+1&offset=1&limit=5") == [old]
+    assert get(api, "/records?" + "&".join(f"{f.replace(' ', '+')}={v.replace(' ', '+')}"
+                                          for f, v in [("FileKey", old["FileKey"])] + [
+                                              (k, old["Sub_Meter"][k]) for k in M.RECORD_KEY_FIELDS[1:]])) == [old]
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+import Meralco as M
+
+BILL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bill_detail.csv")
+
+
+def test_rate_plan_reproduces_bill_total():
+    plan = M.compile_rate_plan(M.load_rate_components(BILL))
+    assert plan.totals(plan.reference_kwh) == plan.reference_total
+
+
+def test_rate_plan_rejects_components_far_from_total():
+    rows = [row if row[0] != "TOTAL" else row[:4] + (row[4] + 500,) for row in M.load_rate_components(BILL)]
+    with pytest.raises(ValueError):
+        M.compile_rate_plan(rows)
+
+
+def test_tenant_plan_leaves_out_the_deposit_and_adjustment():
+    plan = M.compile_rate_plan(M.load_rate_components(BILL))
+    tenant = plan.tenant()
+    assert "Bill Deposit" not in tenant.names and "TOTAL Adjustment" not in tenant.names
+    main_only = sum(round(b, 2) for b, kind in zip(plan.b, plan.kinds) if kind == "main")
+    assert tenant.totals(tenant.reference_kwh) == round(plan.reference_total - main_only, 2)
+    assert tenant.totals(50.0) < plan.totals(50.0) - 150